@@ -0,0 +1,70 @@
+#-*- encoding: utf-8 -*-
+"""Benchmark FASTA index lookups on a draft assembly with many contigs.
+
+A synthetic FASTA file with many short contigs is written to a
+temporary directory, and the following are timed:
+
+- fasta_index_create: building the index.
+- fasta_index_parse: parsing an existing .fai file.
+- fasta_index_read_all: reading every record through the index.
+- fasta_index_stream: reading every record in one streaming pass.
+- fasta_index_by_name: reading records by name.
+
+The benchmarks are run by run_benchmarks.py.
+"""
+
+import os
+import random
+import shutil
+
+import seqpoet
+import synthetic
+
+def add_arguments(parser):
+    """Add the options of the benchmarks to an argument parser."""
+    parser.add_argument('--index-contigs', type=int, default=100000,
+        help=('number of contigs in the FASTA file of the index '
+            'benchmarks (default: %(default)d)'))
+    parser.add_argument('--lookups', type=int, default=10000,
+        help='number of lookups by name (default: %(default)d)')
+
+def benchmarks(tempdir, args):
+    """Get the benchmarks as a list of (name, function) tuples."""
+    fname = os.path.join(tempdir, 'draft.fasta')
+    synthetic.write_fasta(fname, ncontigs=args.index_contigs, min_length=50,
+        max_length=300, seed=args.seed)
+    # A copy with a .fai file, so that the original is indexed from
+    # scratch.
+    indexed = os.path.join(tempdir, 'indexed.fasta')
+    shutil.copy(fname, indexed)
+    fasta = seqpoet.Fasta(indexed)
+    with open(indexed + '.fai', 'w') as f:
+        f.write(str(fasta.index) + '\n')
+    rng = random.Random(args.seed)
+    names = [rng.choice(fasta.index.names) for _ in xrange(args.lookups)]
+
+    def fasta_index_create():
+        seqpoet.FastaIndex(fname + '.fai')
+
+    def fasta_index_parse():
+        seqpoet.Fasta(indexed)
+
+    def fasta_index_read_all():
+        for i in xrange(len(fasta)):
+            fasta.get_record(i)
+
+    def fasta_index_stream():
+        for record in seqpoet.FastaReader(fname):
+            pass
+
+    def fasta_index_by_name():
+        for name in names:
+            fasta.get_record_by_name(name)
+
+    return [
+        ('fasta_index_create', fasta_index_create),
+        ('fasta_index_parse', fasta_index_parse),
+        ('fasta_index_read_all', fasta_index_read_all),
+        ('fasta_index_stream', fasta_index_stream),
+        ('fasta_index_by_name', fasta_index_by_name)
+    ]
@@ -0,0 +1,63 @@
+#-*- encoding: utf-8 -*-
+"""Benchmark pairing of primer hits in ``match_primer``.
+
+Primers binding to a repetitive element give hundreds or thousands of
+hits per strand. The following are timed:
+
+- primer_pairing_product: checking every combination of hits, which
+  is what ``match_primer`` used to do.
+- primer_pairing_sweep: the sorted sweep in ``pair_hits``.
+
+The benchmarks are run by run_benchmarks.py.
+"""
+
+import imp
+import itertools
+import os
+
+rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+seqpoet_script = imp.load_source('seqpoet_script',
+    os.path.join(rootdir, 'bin', 'seqpoet'))
+
+def product_pairs(starts, ends, end_length, min_product, max_product):
+    pairs = []
+    for start, end in itertools.product(starts, ends):
+        if start >= end:
+            continue
+        product_length = end - start + end_length
+        if product_length < min_product or product_length > max_product:
+            continue
+        pairs.append((start, end))
+    return pairs
+
+def add_arguments(parser):
+    """Add the options of the benchmarks to an argument parser."""
+    parser.add_argument('--hits', type=int, default=2000,
+        help=('number of primer hits per strand in the pairing '
+            'benchmarks (default: %(default)d)'))
+    parser.add_argument('--spacing', type=int, default=500,
+        help='distance between repeats (default: %(default)d)')
+
+def benchmarks(tempdir, args):
+    """Get the benchmarks as a list of (name, function) tuples."""
+    # Each repeat holds a forward primer site followed by a reverse
+    # primer site 300 bases downstream. search() reports minus strand
+    # hits in decreasing order, so do the same here.
+    primer_length = 20
+    starts = [i * args.spacing for i in xrange(args.hits)]
+    ends = [x + 300 for x in reversed(starts)]
+    params = (starts, ends, primer_length, 0, args.max_product)
+    assert seqpoet_script.pair_hits(*params) == product_pairs(*params), \
+        'pair_hits and product disagree'
+
+    def primer_pairing_product():
+        product_pairs(*params)
+
+    def primer_pairing_sweep():
+        seqpoet_script.pair_hits(*params)
+
+    return [
+        ('primer_pairing_product', primer_pairing_product),
+        ('primer_pairing_sweep', primer_pairing_sweep)
+    ]
@@ -0,0 +1,50 @@
+#-*- encoding: utf-8 -*-
+"""Benchmark amplicon window restricted primer search.
+
+A random sequence of --length bases with a few planted primer sites is
+searched, and the following are timed:
+
+- window_search_full: searching both primers in the whole sequence.
+- window_search_window: searching the second primer only within
+  --max-product bases of the hits of the first primer.
+
+The benchmarks are run by run_benchmarks.py.
+"""
+
+import imp
+import os
+import random
+
+import seqpoet
+
+rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+seqpoet_script = imp.load_source('seqpoet_script',
+    os.path.join(rootdir, 'bin', 'seqpoet'))
+
+def add_arguments(parser):
+    """Add the options of the benchmarks to an argument parser."""
+    parser.add_argument('--sites', type=int, default=5,
+        help=('number of planted products in the window search '
+            'benchmarks (default: %(default)d)'))
+
+def benchmarks(tempdir, args):
+    """Get the benchmarks as a list of (name, function) tuples."""
+    rng = random.Random(args.seed)
+    primers = [seqpoet.Sequence('acgtagctagctagcatcga'),
+        seqpoet.Sequence('ttgacgatcgatcgagcatt')]
+    seq = [rng.choice('acgt') for _ in xrange(args.length)]
+    for i in xrange(args.sites):
+        pos = rng.randint(0, args.length - 1000)
+        seq[pos:pos + 20] = str(primers[0])
+        seq[pos + 700:pos + 720] = str(primers[1].revcomp())
+    seq = seqpoet.Sequence(''.join(seq))
+
+    def search(window):
+        seqpoet_script.primer_hits(primers, seq, mismatches=args.mismatches,
+            max_product=args.max_product, window=window)
+
+    return [
+        ('window_search_full', lambda: search(False)),
+        ('window_search_window', lambda: search(True))
+    ]
@@ -0,0 +1,236 @@
+#-*- encoding: utf-8 -*-
+"""Time the hot paths of seqpoet on synthetic genomes.
+
+A collection of synthetic GenBank files and a FASTA file with many
+contigs are written to a temporary directory, and the following are
+timed, reporting the best of several repeats:
+
+- search: search.search of a probe in one locus.
+- fasta_create_index: building the index of the FASTA file.
+- fasta_get_record: reading random records through the index.
+- genbank_index: indexing a GenBank file (the GenBank constructor).
+- genbank_getitem: parsing every locus of a GenBank file.
+- find_operon: operon extraction for the matches of a probe.
+- cli: the full command line program on the collection.
+
+together with the benchmarks of the bench_*.py modules, which get
+their own input files and options. The results are written as JSON,
+and a previous result file can be given with --compare to print the
+change for each benchmark.
+"""
+
+from __future__ import print_function
+import argparse
+import datetime
+import imp
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootdir)
+
+import seqpoet
+import synthetic
+
+import bench_fasta_index
+import bench_primer_pairing
+import bench_window_search
+
+#: The modules with additional benchmarks. Each module has the
+#: functions add_arguments(parser) and benchmarks(tempdir, args).
+suites = [bench_fasta_index, bench_primer_pairing, bench_window_search]
+
+seqpoet_script = imp.load_source('seqpoet_script',
+    os.path.join(rootdir, 'bin', 'seqpoet'))
+
+#: The probe planted in the synthetic genomes.
+probe = 'gatcgatcgtacgtagctagcatcgactagc'
+
+def best_of(func, repeat):
+    """Call a function several times.
+
+    Returns a list with the time of each call.
+    """
+    times = []
+    for _ in xrange(repeat):
+        t = time.time()
+        func()
+        times.append(time.time() - t)
+    return times
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                cwd=rootdir, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def setup(tempdir, args):
+    """Write the synthetic files.
+
+    Returns a dictionary with the filenames.
+    """
+    genomedir = os.path.join(tempdir, 'genomes')
+    os.mkdir(genomedir)
+    gb_fnames = synthetic.write_collection(genomedir, nfiles=args.files,
+        nloci=args.loci, length=args.length, probe=probe, seed=args.seed)
+    fasta_fname = os.path.join(tempdir, 'contigs.fasta')
+    synthetic.write_fasta(fasta_fname, ncontigs=args.contigs, probe=probe,
+        seed=args.seed)
+    probe_fname = os.path.join(tempdir, 'probe.txt')
+    with open(probe_fname, 'w') as f:
+        f.write(probe + '\n')
+    return {
+        'genomedir': genomedir,
+        'genbank': gb_fnames[0],
+        'fasta': fasta_fname,
+        'probe': probe_fname
+    }
+
+def benchmarks(files, args):
+    """Get the benchmarks as a list of (name, function) tuples.
+
+    Things that are not being timed are prepared here.
+    """
+    gb = seqpoet.GenBank(files['genbank'])
+    seq = str(gb[0].seq)
+    fasta = seqpoet.Fasta(files['fasta'])
+    rng = random.Random(args.seed)
+    record_keys = [rng.randrange(len(fasta)) for _ in xrange(1000)]
+    seqs = {files['genbank']: gb}
+    matches = seqpoet_script.match_probe(seqpoet.Sequence(probe), seqs,
+        mismatches=args.mismatches)
+
+    def search():
+        seqpoet.search.search(probe, seq, mismatches=args.mismatches)
+
+    def fasta_create_index():
+        seqpoet.FastaIndex(files['fasta'] + '.fai')
+
+    def fasta_get_record():
+        for key in record_keys:
+            fasta.get_record(key)
+
+    def genbank_index():
+        seqpoet.GenBank(files['genbank'])
+
+    def genbank_getitem():
+        for i in xrange(len(gb)):
+            gb[i]
+
+    def find_operon():
+        seqpoet_script.find_operon(matches, seqs)
+
+    def cli():
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable,
+                os.path.join(rootdir, 'bin', 'seqpoet'),
+                '--mismatches', str(args.mismatches), '--out', os.devnull,
+                '--no-cache',
+                files['genomedir'], files['probe']],
+                stderr=devnull, env=dict(os.environ, PYTHONPATH=rootdir))
+
+    return [
+        ('search', search),
+        ('fasta_create_index', fasta_create_index),
+        ('fasta_get_record', fasta_get_record),
+        ('genbank_index', genbank_index),
+        ('genbank_getitem', genbank_getitem),
+        ('find_operon', find_operon),
+        ('cli', cli)
+    ]
+
+def compare(results, fname):
+    """Print the change compared to a previous result file."""
+    with open(fname) as f:
+        baseline = json.load(f)
+    print('\n{0:<24} {1:>10} {2:>10} {3:>8}'.format('benchmark', 'baseline',
+        'current', 'change'))
+    for name, result in results.iteritems():
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['best']
+        new = result['best']
+        print('{0:<24} {1:>9.3f}s {2:>9.3f}s {3:>7.2f}x'.format(name, old,
+            new, old / new if new > 0 else float('inf')))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=4,
+        help='number of GenBank files (default: %(default)d)')
+    parser.add_argument('--loci', type=int, default=1,
+        help='number of loci per GenBank file (default: %(default)d)')
+    parser.add_argument('--length', type=int, default=200000,
+        help='length of each locus (default: %(default)d)')
+    parser.add_argument('--contigs', type=int, default=5000,
+        help='number of contigs in the FASTA file (default: %(default)d)')
+    parser.add_argument('--mismatches', type=int, default=2,
+        help='number of mismatches (default: %(default)d)')
+    parser.add_argument('--max-product', type=int, default=3000,
+        help='maximum product length (default: %(default)d)')
+    for suite in suites:
+        suite.add_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3,
+        help='number of times to run each benchmark (default: %(default)d)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)d)')
+    parser.add_argument('--only', nargs='+', metavar='name',
+        help='only run these benchmarks')
+    parser.add_argument('-o', '--out', metavar='file',
+        help='file for the JSON results (default: stdout)')
+    parser.add_argument('--compare', metavar='file',
+        help='JSON results to compare with')
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        files = setup(tempdir, args)
+        funcs = benchmarks(files, args)
+        for suite in suites:
+            funcs.extend(suite.benchmarks(tempdir, args))
+        results = {}
+        for name, func in funcs:
+            if args.only and name not in args.only:
+                continue
+            times = best_of(func, args.repeat)
+            results[name] = {
+                'best': min(times),
+                'mean': sum(times) / len(times),
+                'times': times
+            }
+            print('{0:<24} {1:.3f} s'.format(name, min(times)),
+                file=sys.stderr)
+    finally:
+        shutil.rmtree(tempdir)
+
+    report = {
+        'seqpoet_version': seqpoet.__version__,
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': dict((k, v) for k, v in vars(args).iteritems() \
+            if k not in ('out', 'compare', 'only')),
+        'results': results
+    }
+
+    if args.out is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
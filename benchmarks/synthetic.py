@@ -0,0 +1,176 @@
+#-*- encoding: utf-8 -*-
+"""Deterministic synthetic genomes for the benchmarks.
+
+The same seed and sizes always give the same files, so timings from
+different commits can be compared. GenBank loci are annotated with
+genes in runs on the same strand, separated by intergenic regions of
+varying length, so that operon extraction has something to do. A probe
+sequence can be planted at the start of some of the genes.
+"""
+
+import itertools
+import os
+import random
+
+#: Sequences for every byte value, for generating four bases at a time.
+_quads = [''.join(x) for x in itertools.product('acgt', repeat=4)]
+
+def random_sequence(rng, length):
+    """Generate a random sequence.
+
+    :param rng: a :py:class:`random.Random` object.
+    :param length: the length of the sequence.
+    :returns: a string.
+    """
+    quads = [_quads[rng.getrandbits(8)] for _ in xrange((length + 3) // 4)]
+    return ''.join(quads)[:length]
+
+def random_genes(rng, length, min_gene=300, max_gene=1500, max_gap=800,
+        operon_size=4):
+    """Generate gene locations along a sequence.
+
+    :param rng: a :py:class:`random.Random` object.
+    :param length: the length of the sequence.
+    :param min_gene: the minimum gene length.
+    :param max_gene: the maximum gene length.
+    :param max_gap: the maximum intergenic distance.
+    :param operon_size: the mean number of consecutive genes on the same
+                        strand.
+    :returns: a list of ``(start, end, strand)`` tuples with 0-based,
+              including start and end positions.
+    """
+    genes = []
+    pos = rng.randint(0, max_gap)
+    strand = '+'
+    while True:
+        glen = rng.randint(min_gene, max_gene)
+        if pos + glen >= length:
+            break
+        genes.append((pos, pos + glen - 1, strand))
+        if rng.random() < 1.0 / operon_size:
+            strand = '-' if strand == '+' else '+'
+            pos += glen + rng.randint(max_gap // 2, max_gap)
+        else:
+            pos += glen + rng.randint(0, max_gap // 4)
+    return genes
+
+def plant(seq, probe, genes, rng, fraction=0.05):
+    """Insert a probe at the start of some genes.
+
+    :param seq: the sequence.
+    :param probe: the probe sequence.
+    :param genes: gene locations as returned by :py:func:`random_genes`.
+    :param rng: a :py:class:`random.Random` object.
+    :param fraction: the fraction of genes to plant the probe in.
+    :returns: the new sequence.
+    """
+    seq = list(seq)
+    for start, end, strand in genes:
+        if rng.random() >= fraction or end - start < 2 * len(probe):
+            continue
+        seq[start + 10:start + 10 + len(probe)] = probe
+    return ''.join(seq)
+
+def format_genbank(name, seq, genes):
+    """Format a GenBank locus.
+
+    :param name: the locus name.
+    :param seq: the sequence.
+    :param genes: gene locations as returned by :py:func:`random_genes`.
+    :returns: a string.
+    """
+    lines = [
+        'LOCUS       {0:<16}{1:>12} bp    DNA     linear   BCT 01-JAN-2015' \
+            .format(name, len(seq)),
+        'DEFINITION  Synthetic sequence {0}.'.format(name),
+        'ACCESSION   {0}'.format(name),
+        'FEATURES             Location/Qualifiers',
+        '     source          1..{0}'.format(len(seq)),
+        '                     /organism="synthetic"'
+    ]
+    for i, (start, end, strand) in enumerate(genes):
+        location = '{0}..{1}'.format(start + 1, end + 1)
+        if strand == '-':
+            location = 'complement({0})'.format(location)
+        tag = '{0}_{1:05d}'.format(name, i + 1)
+        for ftype in ('gene', 'CDS'):
+            lines.append('     {0:<16}{1}'.format(ftype, location))
+            lines.append('                     /locus_tag="{0}"'.format(tag))
+        lines.append('                     /product="protein {0}"'.format(
+            i + 1))
+    lines.append('ORIGIN')
+    for i in xrange(0, len(seq), 60):
+        chunk = seq[i:i + 60]
+        lines.append('{0:>9} {1}'.format(i + 1, ' '.join(chunk[j:j + 10] \
+            for j in xrange(0, len(chunk), 10))))
+    lines.append('//')
+    return '\n'.join(lines) + '\n'
+
+def write_genbank(fname, nloci=1, length=100000, probe=None, seed=0):
+    """Write a GenBank file with synthetic annotated loci.
+
+    :param fname: the filename.
+    :param nloci: the number of loci.
+    :param length: the length of each locus.
+    :param probe: a probe sequence to plant in some genes, or ``None``.
+    :param seed: the random seed.
+    :returns: the total number of genes.
+    """
+    rng = random.Random(seed)
+    base = os.path.splitext(os.path.basename(fname))[0].upper()
+    ngenes = 0
+    with open(fname, 'w') as f:
+        for i in xrange(nloci):
+            seq = random_sequence(rng, length)
+            genes = random_genes(rng, length)
+            if probe is not None:
+                seq = plant(seq, probe, genes, rng)
+            f.write(format_genbank('{0}{1}'.format(base, i + 1), seq, genes))
+            ngenes += len(genes)
+    return ngenes
+
+def write_fasta(fname, ncontigs=1000, min_length=500, max_length=5000,
+        probe=None, seed=0, width=60):
+    """Write a FASTA file with random contigs.
+
+    :param fname: the filename.
+    :param ncontigs: the number of contigs.
+    :param min_length: the minimum contig length.
+    :param max_length: the maximum contig length.
+    :param probe: a probe sequence to insert in some contigs, or ``None``.
+    :param seed: the random seed.
+    :param width: the number of bases per line.
+    :returns: the total number of bases.
+    """
+    rng = random.Random(seed)
+    nbases = 0
+    with open(fname, 'w') as f:
+        for i in xrange(ncontigs):
+            seq = random_sequence(rng, rng.randint(min_length, max_length))
+            if probe is not None and rng.random() < 0.05:
+                pos = rng.randint(0, len(seq) - len(probe))
+                seq = seq[:pos] + probe + seq[pos + len(probe):]
+            f.write('>contig{0}\n'.format(i + 1))
+            for j in xrange(0, len(seq), width):
+                f.write(seq[j:j + width] + '\n')
+            nbases += len(seq)
+    return nbases
+
+def write_collection(dirname, nfiles=4, nloci=1, length=100000, probe=None,
+        seed=0):
+    """Write a directory of synthetic GenBank files.
+
+    :param dirname: the directory, which must exist.
+    :param nfiles: the number of files.
+    :param nloci: the number of loci per file.
+    :param length: the length of each locus.
+    :param probe: a probe sequence to plant in some genes, or ``None``.
+    :param seed: the random seed of the first file.
+    :returns: a list of filenames.
+    """
+    fnames = []
+    for i in xrange(nfiles):
+        fname = os.path.join(dirname, 'genome{0}.gb'.format(i + 1))
+        write_genbank(fname, nloci, length, probe, seed + i)
+        fnames.append(fname)
+    return fnames
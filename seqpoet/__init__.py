@@ -1,6 +1,13 @@
-from fasta import Fasta, FastaIndex, FastaRecord
+from fasta import Fasta, FastaIndex, FastaReader, FastaRecord, FastaWriter
 from genbank import GenBank, GenBankLocus, GenBankFeature
 from sequence import Sequence
+import instrument
 import search
+import bgzf
+import cache
+import bloom
+import fmindex
+import shared
+import twobit
 
 __version__ = '0.3.4'
@@ -0,0 +1,343 @@
+#-*- encoding: utf-8 -*-
+"""Functions and classes for reading gzip and BGZF compressed files.
+
+BGZF is the blocked gzip format written by ``bgzip``. It is a series of
+gzip members of at most 64 kB each, so a position in the uncompressed
+data can be reached by decompressing a single block. The blocks are
+listed in a ``.gzi`` index, in the same format as ``bgzip -i`` and
+``samtools faidx`` use.
+
+.. module:: bgzf
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import bisect
+import gzip
+import os
+import struct
+import zlib
+
+from seqpoet import instrument
+
+#: The first bytes of a gzip file.
+gzip_magic = '\x1f\x8b'
+
+def is_gzip(fname):
+    """Check whether a file is gzip compressed.
+
+    :param fname: filename.
+    :returns: True if the file starts with the gzip magic number.
+    """
+    with open(fname, 'rb') as f:
+        return f.read(2) == gzip_magic
+
+def _block_size(header, extra):
+    """Get the size of a BGZF block from its header.
+
+    Returns ``None`` if the header is not a BGZF header.
+    """
+    if len(header) < 12 or header[:2] != gzip_magic or \
+            not ord(header[3]) & 4:
+        return None
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[i + 2:i + 4])[0]
+        if extra[i:i + 2] == 'BC' and slen == 2:
+            return struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+        i += 4 + slen
+    return None
+
+def _read_block_header(f):
+    """Read the header of the BGZF block at the current file position.
+
+    Returns the size of the block, or ``None`` at the end of the file
+    or if the block is not a BGZF block.
+    """
+    header = f.read(12)
+    if len(header) < 12:
+        return None
+    xlen = struct.unpack('<H', header[10:12])[0]
+    return _block_size(header, f.read(xlen))
+
+def is_bgzf(fname):
+    """Check whether a file is BGZF compressed.
+
+    :param fname: filename.
+    :returns: True if the first gzip member of the file is a BGZF block.
+    """
+    with open(fname, 'rb') as f:
+        return _read_block_header(f) is not None
+
+def build_index(fname):
+    """Build the block index of a BGZF file.
+
+    Only the block headers and trailers are read, so no data is
+    decompressed.
+
+    :param fname: filename of the BGZF file.
+    :returns: a list of ``(compressed_offset, uncompressed_offset)``
+              tuples, one per block, followed by a tuple with the
+              compressed and uncompressed sizes of the file.
+    :raises: ValueError if the file is not BGZF compressed.
+    """
+    index = []
+    coffset = 0
+    uoffset = 0
+    size = os.path.getsize(fname)
+    with open(fname, 'rb') as f:
+        while coffset < size:
+            f.seek(coffset)
+            bsize = _read_block_header(f)
+            if bsize is None:
+                raise ValueError('not a BGZF file: {0}'.format(fname))
+            f.seek(coffset + bsize - 4)
+            isize = struct.unpack('<I', f.read(4))[0]
+            index.append((coffset, uoffset))
+            coffset += bsize
+            uoffset += isize
+    index.append((coffset, uoffset))
+    return index
+
+def read_gzi(fname):
+    """Read a ``.gzi`` index written by ``bgzip -i`` or :py:func:`write_gzi`.
+
+    :param fname: filename of the index.
+    :returns: a list of ``(compressed_offset, uncompressed_offset)``
+              tuples, including the first block at ``(0, 0)``.
+    """
+    with open(fname, 'rb') as f:
+        n = struct.unpack('<Q', f.read(8))[0]
+        data = struct.unpack('<{0}Q'.format(2 * n), f.read(16 * n))
+    return [(0, 0)] + zip(data[::2], data[1::2])
+
+def write_gzi(fname, index):
+    """Write a ``.gzi`` index.
+
+    The first block, which is always at ``(0, 0)``, is left out, as
+    in the indexes written by ``bgzip -i``.
+
+    :param fname: filename of the index.
+    :param index: a list of ``(compressed_offset, uncompressed_offset)``
+                  tuples.
+    """
+    entries = [x for x in index if x != (0, 0)]
+    with open(fname, 'wb') as f:
+        f.write(struct.pack('<Q', len(entries)))
+        for coffset, uoffset in entries:
+            f.write(struct.pack('<QQ', coffset, uoffset))
+
+def load_index(fname, suffix='.gzi'):
+    """Get the block index of a BGZF file.
+
+    The index is read from FILE.gzi if it is newer than the file, and
+    otherwise built and written to FILE.gzi. Failing to write the index
+    is not an error.
+
+    :param fname: filename of the BGZF file.
+    :param suffix: the suffix of the index file.
+    :returns: see :py:func:`build_index`.
+    """
+    gzi = fname + suffix
+    index = None
+    if os.path.isfile(gzi) and \
+            os.path.getmtime(gzi) >= os.path.getmtime(fname):
+        try:
+            index = read_gzi(gzi)
+        except struct.error:
+            index = None
+    if instrument.enabled:
+        instrument.cache_lookup('gzi', fname, index is not None)
+    if index is None:
+        index = build_index(fname)
+        try:
+            write_gzi(gzi, index[:-1])
+        except (IOError, OSError):
+            pass
+        return index
+
+    # The index file does not include the end of the file.
+    with open(fname, 'rb') as f:
+        f.seek(index[-1][0])
+        bsize = _read_block_header(f)
+        f.seek(index[-1][0] + bsize - 4)
+        isize = struct.unpack('<I', f.read(4))[0]
+    index.append((index[-1][0] + bsize, index[-1][1] + isize))
+    return index
+
+class BgzfReader(object):
+
+    """Read a BGZF compressed file as if it was uncompressed.
+
+    The reader supports the file methods used by the parsers in this
+    package, and ``seek`` and ``tell`` use positions in the
+    uncompressed data. Seeking only decompresses the block containing
+    the new position.
+
+    :param fname: filename of the BGZF file.
+    :param index: the block index of the file. If ``None``, it is
+                  loaded with :py:func:`load_index`.
+    """
+
+    def __init__(self, fname, index=None):
+        self.filename = fname
+        self.name = fname
+        if index is None:
+            index = load_index(fname)
+        self._coffsets = [x[0] for x in index]
+        self._uoffsets = [x[1] for x in index]
+        self._file = open(fname, 'rb')
+        self._block = -1
+        self._data = ''
+        self._pos = 0
+
+    def _load(self, block):
+        """Decompress a block and make it the current block."""
+        self._block = block
+        self._pos = 0
+        if block >= len(self._coffsets) - 1:
+            self._data = ''
+            return
+        self._file.seek(self._coffsets[block])
+        raw = self._file.read(self._coffsets[block + 1] - \
+            self._coffsets[block])
+        self._data = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+
+    def _next_block(self):
+        """Move to the next non-empty block.
+
+        Returns False at the end of the file.
+        """
+        while self._pos >= len(self._data):
+            if self._block >= len(self._coffsets) - 1:
+                return False
+            self._load(self._block + 1)
+        return True
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.tell()
+        elif whence == 2:
+            offset += self._uoffsets[-1]
+        block = bisect.bisect_right(self._uoffsets, offset) - 1
+        # Empty blocks share their offset with the next block.
+        while block > 0 and self._uoffsets[block] == self._uoffsets[block - 1]:
+            block -= 1
+        block = max(0, min(block, len(self._coffsets) - 1))
+        if block != self._block:
+            self._load(block)
+        self._pos = offset - self._uoffsets[block]
+
+    def tell(self):
+        if self._block < 0:
+            return 0
+        return self._uoffsets[self._block] + self._pos
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0 and self._next_block():
+            if size < 0:
+                end = len(self._data)
+            else:
+                end = min(len(self._data), self._pos + size)
+                size -= end - self._pos
+            parts.append(self._data[self._pos:end])
+            self._pos = end
+        return ''.join(parts)
+
+    def readline(self):
+        parts = []
+        while self._next_block():
+            end = self._data.find('\n', self._pos)
+            if end >= 0:
+                parts.append(self._data[self._pos:end + 1])
+                self._pos = end + 1
+                break
+            parts.append(self._data[self._pos:])
+            self._pos = len(self._data)
+        return ''.join(parts)
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def __iter__(self):
+        return self
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '<BgzfReader for {0}>'.format(self.filename)
+
+def open_file(fname):
+    """Open a plain, gzip or BGZF compressed file for reading.
+
+    BGZF files are opened with a :py:class:`BgzfReader`, which supports
+    fast seeking. Other gzip files are decompressed while they are
+    read, and seeking backwards in them means decompressing them from
+    the start again.
+
+    :param fname: filename.
+    :returns: a file-like object.
+    """
+    if not is_gzip(fname):
+        return open(fname)
+    if is_bgzf(fname):
+        return BgzfReader(fname)
+    return gzip.open(fname)
+
+def data_size(fname):
+    """Get the uncompressed size of a file.
+
+    :param fname: filename of a plain, gzip or BGZF compressed file.
+    :returns: the number of bytes of uncompressed data. For a gzip
+              file, this is the size of the last gzip member modulo
+              2^32, as stored in the file.
+    """
+    if not is_gzip(fname):
+        return os.path.getsize(fname)
+    if is_bgzf(fname):
+        return load_index(fname)[-1][1]
+    with open(fname, 'rb') as f:
+        f.seek(-4, 2)
+        return struct.unpack('<I', f.read(4))[0]
+
+def _compress_block(data):
+    """Compress data into a single BGZF block."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+        -zlib.MAX_WBITS)
+    cdata = compressor.compress(data) + compressor.flush()
+    extra = struct.pack('<2sHH', 'BC', 2, len(cdata) + 25)
+    header = struct.pack('<BBBBIBBH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff,
+        len(extra))
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+    return header + extra + cdata + trailer
+
+def compress_file(fname, outname=None, block_size=0xff00):
+    """Compress a file with BGZF, like ``bgzip`` does.
+
+    :param fname: filename of the file to compress.
+    :param outname: filename of the compressed file. Defaults to the
+                    filename with '.gz' appended.
+    :param block_size: the number of uncompressed bytes per block.
+    :returns: the filename of the compressed file.
+    """
+    if outname is None:
+        outname = fname + '.gz'
+    with open(fname, 'rb') as fin:
+        with open(outname, 'wb') as fout:
+            while True:
+                data = fin.read(block_size)
+                if not data:
+                    break
+                fout.write(_compress_block(data))
+            fout.write(_compress_block(''))
+    return outname
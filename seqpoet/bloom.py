@@ -0,0 +1,168 @@
+#-*- encoding: utf-8 -*-
+"""Bloom filters of sequence k-mers for ruling out matches without
+searching.
+
+.. module:: bloom
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import zlib
+
+from seqpoet.bgzf import data_size
+from seqpoet.cache import load_sidecar, save_sidecar
+from seqpoet.sequence import Sequence
+from seqpoet.twobit import TwoBit
+
+class BloomFilter(object):
+
+    """Represent a Bloom filter of strings.
+
+    A Bloom filter answers whether an item might have been added to it.
+    There are no false negatives, but there can be false positives.
+    The bit positions of an item are derived from the CRC-32 and
+    Adler-32 checksums of the item, so a filter can be saved and used
+    again by another process.
+
+    :param nbits: the size of the filter in bits.
+    :param nhashes: the number of bits set for each item.
+    """
+
+    def __init__(self, nbits, nhashes=4):
+        self.nbits = max(8, nbits)
+        self.nhashes = nhashes
+        self.bits = bytearray((self.nbits + 7) // 8)
+
+    def _positions(self, item):
+        h1 = zlib.crc32(item) & 0xffffffff
+        h2 = zlib.adler32(item) & 0xffffffff | 1
+        return [(h1 + i * h2) % self.nbits for i in xrange(self.nhashes)]
+
+    def add(self, item):
+        """Add an item to the filter.
+
+        :param item: a string.
+        """
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) \
+            for pos in self._positions(item))
+
+class KmerFilter(object):
+
+    """Represent a Bloom filter of the k-mers of a set of sequences.
+
+    The filter can prove that a needle cannot be found with a given
+    number of mismatches. If a needle is split into ``mismatches + 1``
+    parts, at least one of the parts must match exactly wherever the
+    needle matches (the pigeonhole principle), and then every k-mer of
+    that part occurs in the sequences. If each part has a k-mer that is
+    not in the filter, the needle does not occur.
+
+    **Class attributes:**
+
+        - **k:** the k-mer length.
+        - **bloom:** the :py:class:`.BloomFilter` holding the k-mers.
+
+    :param k: the k-mer length.
+    :param nkmers: the expected number of k-mers, used for sizing the
+                   filter.
+    :param bits_per_kmer: the number of filter bits per expected k-mer.
+    :param nhashes: the number of bits set for each k-mer.
+    """
+
+    def __init__(self, k=12, nkmers=0, bits_per_kmer=8, nhashes=4):
+        self.k = k
+        self.bloom = BloomFilter(nkmers * bits_per_kmer, nhashes)
+
+    @classmethod
+    def from_records(cls, records, k=12, nkmers=None, bits_per_kmer=8,
+            nhashes=4):
+        """Build a filter from the k-mers of a set of records.
+
+        :param records: an iterable of objects with a ``seq`` attribute,
+                        e.g. :py:class:`.FastaRecord` or
+                        :py:class:`.GenBankLocus` objects.
+        :param k: the k-mer length.
+        :param nkmers: the expected number of k-mers. If ``None``, the
+                       records are traversed twice to count them.
+        :param bits_per_kmer: the number of filter bits per k-mer.
+        :param nhashes: the number of bits set for each k-mer.
+        :returns: a :py:class:`.KmerFilter` object.
+        """
+        if nkmers is None:
+            records = list(records)
+            nkmers = sum(max(0, len(x.seq) - k + 1) for x in records)
+        kmer_filter = cls(k, nkmers, bits_per_kmer, nhashes)
+        add = kmer_filter.bloom.add
+        for record in records:
+            seq = str(record.seq)
+            for i in xrange(len(seq) - k + 1):
+                add(seq[i:i + k])
+        return kmer_filter
+
+    def may_contain(self, needle, mismatches=0):
+        """Test whether a needle might occur in the forward strand.
+
+        :param needle: a string.
+        :param mismatches: the maximum number of mismatches allowed.
+        :returns: False if the needle cannot occur with at most
+                  ``mismatches`` mismatches, otherwise True.
+        """
+        k = self.k
+        nparts = mismatches + 1
+        if len(needle) // nparts < k:
+            # At least one part is too short to say anything about.
+            return True
+        bounds = [len(needle) * i // nparts for i in xrange(nparts + 1)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            part = needle[start:end]
+            if all(part[i:i + k] in self.bloom \
+                    for i in xrange(len(part) - k + 1)):
+                return True
+        return False
+
+    def may_occur(self, needle, mismatches=0):
+        """Test whether a needle might occur on either strand.
+
+        :param needle: a string or a :py:class:`.Sequence` object.
+        :param mismatches: the maximum number of mismatches allowed.
+        :returns: False if the needle cannot occur on any of the strands
+                  with at most ``mismatches`` mismatches, otherwise True.
+        """
+        if not isinstance(needle, Sequence):
+            needle = Sequence(needle)
+        return self.may_contain(str(needle), mismatches) or \
+            self.may_contain(str(needle.revcomp()), mismatches)
+
+def genome_filter(seqfile, k=12, suffix='.bloom'):
+    """Get the k-mer filter of a sequence file.
+
+    The filter is stored in a sidecar file next to the sequence file
+    and is built only if the sidecar is missing, was built with another
+    k-mer length or is older than the sequence file. If the sidecar
+    cannot be written, the filter is still returned.
+
+    :param seqfile: a :py:class:`.GenBank`, :py:class:`.Fasta` or
+                    similar object with a ``filename`` attribute that
+                    iterates over records.
+    :param k: the k-mer length.
+    :param suffix: the suffix of the sidecar file.
+    :returns: a :py:class:`.KmerFilter` object.
+    """
+    kmer_filter = load_sidecar(seqfile.filename, suffix, k)
+    if kmer_filter is not None:
+        return kmer_filter
+
+    if isinstance(seqfile, TwoBit):
+        nkmers = sum(seqfile.lengths)
+    else:
+        # The size of the uncompressed data is an upper bound of the
+        # number of bases.
+        nkmers = data_size(seqfile.filename)
+    kmer_filter = KmerFilter.from_records(seqfile, k, nkmers=nkmers)
+    save_sidecar(seqfile.filename, suffix, kmer_filter, k)
+
+    return kmer_filter
@@ -0,0 +1,608 @@
+#-*- encoding: utf-8 -*-
+"""Classes for caching parsed sequence files and search results on disk.
+
+.. module:: cache
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import cPickle
+import hashlib
+import os
+import struct
+import tempfile
+
+from seqpoet import instrument
+from seqpoet.fasta import Fasta, FastaReader, FastaRecord
+from seqpoet.genbank import GenBank, GenBankLocus
+from seqpoet.sequence import Sequence
+
+class CachedGenome(object):
+
+    """Represent a parsed sequence file stored in a :py:class:`.GenomeCache`.
+
+    A CachedGenome behaves like a :py:class:`.GenBank` or
+    :py:class:`.Fasta` object, but the records are read from the cache
+    file instead of being parsed from the original file. Each record is
+    read from its own position in the cache file when it is needed, so
+    no records are kept in memory.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the original sequence file.
+        - **format:** the format of the original file, either 'genbank'
+          or 'fasta'.
+
+    :param filename: the filename of the original sequence file.
+    :param fmt: the format of the original file.
+    :param path: the filename of the cache file.
+    :param entries: a list of (offset, length) tuples giving the position
+                    of each record in the cache file and the length of
+                    its sequence.
+    :param checksums: an optional list with the checksums of the
+                      sequences of the records.
+    """
+
+    def __init__(self, filename, fmt, path, entries, checksums=None):
+        self.filename = filename
+        self.format = fmt
+        self.path = path
+        self._entries = entries
+        self._checksums = checksums
+
+    def _read_record(self, f, index):
+        """Read a record from the open cache file.
+
+        Returns:
+            a GenBankLocus or FastaRecord object.
+        """
+        offset, length = self._entries[index]
+        f.seek(offset)
+        meta = cPickle.load(f)
+        seq = Sequence(f.read(length))
+        if instrument.enabled:
+            instrument.emit('bytes_read', f.tell() - offset,
+                filename=self.filename)
+        if self.format == 'genbank':
+            name, features, header = meta
+            return GenBankLocus(name, seq, features, header)
+        return FastaRecord(seq, meta)
+
+    def checksum(self, index):
+        """Get the checksum of the sequence of a record.
+
+        :param index: the index of the record.
+        :returns: the checksum as a hexadecimal string, or ``None`` if
+                  the cache file has no checksums.
+        """
+        if self._checksums is None:
+            return None
+        return self._checksums[index]
+
+    def __getitem__(self, index):
+        with open(self.path, 'rb') as f:
+            return self._read_record(f, index)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for i in xrange(len(self)):
+                yield self._read_record(f, i)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<CachedGenome for {0}>'.format(self.filename)
+
+class GenomeCache(object):
+
+    """Represent a directory of parsed sequence files.
+
+    Each sequence file is stored in one cache file, keyed on the
+    absolute path of the file. The sequences are stored as plain bytes,
+    each preceded by a small pickle with the name of the record and,
+    for GenBank loci, the header and the feature objects, which are
+    pickled as they are. A pickled table of the positions of the
+    records and the checksums of their sequences is stored at the end.
+    A cached entry is only used if the size and modification time of
+    the file are unchanged since it was stored.
+
+    :param cache_dir: the directory to store the cache in. It is
+                      created if it does not exist.
+    """
+
+    #: Version of the cache file layout.
+    version = 3
+
+    #: Layout of the trailer giving the offset of the record table.
+    _trailer = struct.Struct('<Q')
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, fname):
+        """Get the cache filename for a sequence file."""
+        key = hashlib.sha1(os.path.abspath(fname)).hexdigest()
+        return os.path.join(self.cache_dir, key + '.pickle')
+
+    def _stamp(self, fname):
+        """Get the values identifying the current state of a file."""
+        st = os.stat(fname)
+        return {
+            'version': GenomeCache.version,
+            'filename': os.path.abspath(fname),
+            'size': st.st_size,
+            'mtime': st.st_mtime
+        }
+
+    def load(self, fname):
+        """Get a cached genome.
+
+        :param fname: filename of the sequence file.
+        :returns: a :py:class:`.CachedGenome` object, or ``None`` if the
+                  file is not in the cache or if the file has changed
+                  since it was cached.
+        """
+        genome = self._load(fname)
+        if instrument.enabled:
+            instrument.cache_lookup('genome', fname, genome is not None)
+        return genome
+
+    def _load(self, fname):
+        """Get a cached genome without reporting the lookup."""
+        path = self._path(fname)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = cPickle.load(f)
+                stamp = self._stamp(fname)
+                if not isinstance(header, dict) or \
+                        any(header.get(k) != v for k, v in stamp.iteritems()):
+                    return None
+                f.seek(-self._trailer.size, os.SEEK_END)
+                offset, = self._trailer.unpack(f.read(self._trailer.size))
+                f.seek(offset)
+                table = cPickle.load(f)
+        except (EOFError, IOError, ValueError, struct.error,
+                cPickle.UnpicklingError):
+            return None
+        return CachedGenome(fname, header['format'], path, table['entries'],
+            checksums=table['checksums'])
+
+    def store(self, seqfile):
+        """Store all records of a sequence file in the cache.
+
+        The records are written one at a time as they are read, so only
+        one record of the file is in memory at a time.
+
+        :param seqfile: a :py:class:`.GenBank`, :py:class:`.Fasta` or
+                        :py:class:`.FastaReader` object.
+        :returns: a :py:class:`.CachedGenome` object.
+        :raises: TypeError if ``seqfile`` is of an unsupported type.
+        """
+        if isinstance(seqfile, GenBank):
+            fmt = 'genbank'
+        elif isinstance(seqfile, (Fasta, FastaReader)):
+            fmt = 'fasta'
+        else:
+            raise TypeError('only GenBank and Fasta objects can be cached')
+
+        header = self._stamp(seqfile.filename)
+        header['format'] = fmt
+        table = {'entries': [], 'checksums': []}
+
+        path = self._path(seqfile.filename)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir,
+                delete=False) as f:
+            try:
+                cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+                for record in seqfile:
+                    seq = str(record.seq)
+                    if fmt == 'genbank':
+                        meta = (record.name, record.features, record.header)
+                    else:
+                        meta = record.name
+                    table['entries'].append((f.tell(), len(seq)))
+                    table['checksums'].append(record.seq.checksum())
+                    cPickle.dump(meta, f, cPickle.HIGHEST_PROTOCOL)
+                    f.write(seq)
+                offset = f.tell()
+                cPickle.dump(table, f, cPickle.HIGHEST_PROTOCOL)
+                f.write(self._trailer.pack(offset))
+            except:
+                os.remove(f.name)
+                raise
+        os.rename(f.name, path)
+
+        return CachedGenome(seqfile.filename, fmt, path, table['entries'],
+            table['checksums'])
+
+def _sidecar_stamp(fname, params):
+    st = os.stat(fname)
+    return {'params': params, 'size': st.st_size, 'mtime': st.st_mtime}
+
+def load_sidecar(fname, suffix, params=None):
+    """Load an object stored next to a sequence file.
+
+    :param fname: filename of the sequence file.
+    :param suffix: the suffix of the sidecar file, e.g. '.bloom'.
+    :param params: parameters that the object was built with. The
+                   stored object is only returned if they are equal.
+    :returns: the stored object, or ``None`` if there is no sidecar, if
+              it was built with other parameters or if the sequence file
+              has changed since it was stored.
+    """
+    obj = _load_sidecar(fname, suffix, params)
+    if instrument.enabled:
+        instrument.cache_lookup(suffix.lstrip('.'), fname, obj is not None)
+    return obj
+
+def _load_sidecar(fname, suffix, params=None):
+    sidecar = fname + suffix
+    if not os.path.isfile(sidecar):
+        return None
+    try:
+        with open(sidecar, 'rb') as f:
+            if cPickle.load(f) != _sidecar_stamp(fname, params):
+                return None
+            return cPickle.load(f)
+    except (EOFError, cPickle.UnpicklingError):
+        return None
+
+def save_sidecar(fname, suffix, obj, params=None):
+    """Store an object next to a sequence file.
+
+    Failing to write the sidecar, e.g. because the directory is read
+    only, is not an error.
+
+    :param fname: filename of the sequence file.
+    :param suffix: the suffix of the sidecar file, e.g. '.bloom'.
+    :param obj: the object to store.
+    :param params: parameters that the object was built with.
+    :returns: True if the sidecar was written, otherwise False.
+    """
+    sidecar = fname + suffix
+    try:
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(os.path.abspath(sidecar)),
+                delete=False) as f:
+            cPickle.dump(_sidecar_stamp(fname, params), f,
+                cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(f.name, sidecar)
+    except (IOError, OSError):
+        return False
+    return True
+
+def indexed_fasta(fname, suffix='.fidx'):
+    """Open a FASTA file through an index stored next to it.
+
+    The first time, the file is indexed and the :py:class:`.FastaIndex`,
+    including the checksums of the sequences, is stored in a sidecar
+    file. Later runs load the index instead of reading the whole file.
+    If the file has a samtools FILE.fai index, that is used and nothing
+    is stored, since it has no checksums.
+
+    :param fname: filename of the FASTA file.
+    :param suffix: the suffix of the sidecar file.
+    :returns: a :py:class:`.Fasta` object.
+    :raises: ValueError if the file cannot be indexed, see
+             :py:class:`.Fasta`.
+    """
+    index = load_sidecar(fname, suffix)
+    if index is not None:
+        return Fasta(fname, index=index)
+    fasta = Fasta(fname)
+    if None not in fasta.index.checksums:
+        save_sidecar(fname, suffix, fasta.index)
+    return fasta
+
+def file_checksum(fname, bufsize=1 << 20):
+    """Get the MD5 checksum of the contents of a file.
+
+    :param fname: the filename.
+    :param bufsize: the number of bytes to read at a time.
+    :returns: the checksum as a hexadecimal string.
+    """
+    checksum = hashlib.md5()
+    with open(fname, 'rb') as f:
+        while True:
+            block = f.read(bufsize)
+            if not block:
+                break
+            checksum.update(block)
+    return checksum.hexdigest()
+
+class ResultCache(object):
+
+    """Represent a directory of search results.
+
+    The results of a query are stored per sequence file, keyed on the
+    query and on the checksum of the contents of the file, so results
+    are reused as long as the file is unchanged, even if it is moved.
+    The checksum of a file is stored together with its size and
+    modification time, and is only computed again when they change. A
+    file without a stored checksum is only hashed when results are
+    stored, or when results of the query for a file of the same size
+    are in the cache, so looking up new files does not read them.
+    When the cache grows larger than ``max_size`` bytes,
+    :py:meth:`evict` removes the least recently used entries. Failing
+    to write an entry is not an error.
+
+    :param cache_dir: the directory to store the cache in. It is
+                      created if it does not exist.
+    :param max_size: the maximum size of the cache in bytes.
+    """
+
+    #: Version of the cache file layout.
+    version = 2
+
+    def __init__(self, cache_dir, max_size=256 << 20):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._checksums = {}
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _key_path(self, key, ext):
+        """Get the filename of an entry with a picklable key."""
+        key = hashlib.sha1(cPickle.dumps((ResultCache.version,) + key))
+        return os.path.join(self.cache_dir, key.hexdigest() + ext)
+
+    def _path(self, query, fname):
+        """Get the cache filename for the results of a query in a file."""
+        return self._key_path((query, self._checksum(fname)), '.pickle')
+
+    def _size_path(self, query, fname):
+        """Get the filename of the marker of a query and a file size."""
+        return self._key_path((query, os.path.getsize(fname)), '.size')
+
+    def _checksum(self, fname, compute=True):
+        """Get the checksum of the contents of a file.
+
+        Args:
+            fname: the filename.
+            compute: whether to compute the checksum if it is not
+                stored for the current size and modification time.
+        Returns:
+            the checksum, or None if it is not stored and compute is
+            False.
+        """
+        if fname in self._checksums:
+            return self._checksums[fname]
+        st = os.stat(fname)
+        stamp_path = self._key_path((os.path.abspath(fname),), '.stamp')
+        try:
+            with open(stamp_path, 'rb') as f:
+                size, mtime, checksum = cPickle.load(f)
+            if (size, mtime) == (st.st_size, st.st_mtime):
+                self._checksums[fname] = checksum
+                return checksum
+        except (EOFError, ValueError, cPickle.UnpicklingError, IOError):
+            pass
+        if not compute:
+            return None
+        checksum = file_checksum(fname)
+        self._checksums[fname] = checksum
+        self._write(stamp_path, (st.st_size, st.st_mtime, checksum))
+        return checksum
+
+    def _write(self, path, obj):
+        """Write a pickled object to a file in the cache.
+
+        Returns:
+            True if the file was written, otherwise False.
+        """
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir,
+                    delete=False) as f:
+                cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(f.name, path)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def load(self, query, fname):
+        """Get the cached results of a query in a file.
+
+        A successful lookup marks the entry as recently used.
+
+        :param query: a picklable object with everything that affects
+                      the results, e.g. the probes and the search
+                      parameters.
+        :param fname: filename of the sequence file.
+        :returns: the stored results, or ``None`` if they are not in
+                  the cache.
+        """
+        checksum = self._checksum(fname,
+            compute=os.path.isfile(self._size_path(query, fname)))
+        path = None
+        if checksum is not None:
+            path = self._key_path((query, checksum), '.pickle')
+        results = None
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    results = cPickle.load(f)
+                os.utime(path, None)
+            except (EOFError, cPickle.UnpicklingError, IOError, OSError):
+                results = None
+        if instrument.enabled:
+            instrument.cache_lookup('results', fname, results is not None)
+        return results
+
+    def store(self, query, fname, results):
+        """Store the results of a query in a file.
+
+        :param query: the query, as given to :py:meth:`load`.
+        :param fname: filename of the sequence file.
+        :param results: a picklable object.
+        :returns: True if the results were written, otherwise False.
+        """
+        if not self._write(self._path(query, fname), results):
+            return False
+        self._write(self._size_path(query, fname), None)
+        return True
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits.
+
+        :returns: the number of removed entries.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pickle'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(x[1] for x in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+class Checkpoint(object):
+
+    """Represent a journal of the files that a search has finished.
+
+    The results of each file are appended to the journal as soon as
+    the file has been searched, so a run that is interrupted can be
+    resumed without searching those files again. The journal starts
+    with the query, and only a journal of the same query is resumed.
+    A result is only used if the size and modification time of the
+    file are unchanged since it was written. Each entry is prefixed
+    with its length, and a journal that was cut off while an entry was
+    written is truncated after the last complete entry.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the journal.
+        - **query:** the query of the search.
+        - **done:** a dictionary with the results of the finished
+          files, keyed on filename.
+
+    :param fname: filename of the journal.
+    :param query: a picklable object with everything that affects the
+                  results, as for :py:class:`.ResultCache`.
+    :param resume: if True, the results in an existing journal are
+                   kept. Otherwise a new journal is started.
+    :raises: ValueError if a journal that is resumed is for another
+             query.
+    """
+
+    #: Version of the journal layout.
+    version = 3
+
+    def __init__(self, fname, query, resume=False):
+        self.filename = fname
+        self.query = query
+        self.done = {}
+
+        header = {'version': Checkpoint.version, 'query': query}
+        if resume and os.path.isfile(fname):
+            self._read(header)
+            self.file = open(fname, 'ab')
+        else:
+            self.file = open(fname, 'wb')
+            self._write(header)
+
+    def _read(self, header):
+        """Read the entries of an existing journal."""
+        end = 0
+        with open(self.filename, 'rb') as f:
+            if self._read_entry(f) != header:
+                raise ValueError('checkpoint {0} is for another search' \
+                    .format(self.filename))
+            while True:
+                end = f.tell()
+                entry = self._read_entry(f)
+                if entry is None:
+                    break
+                fname, stamp, results = entry
+                if os.path.isfile(fname) and stamp == self._stamp(fname):
+                    self.done[fname] = results
+                else:
+                    self.done.pop(fname, None)
+        with open(self.filename, 'r+b') as f:
+            f.truncate(end)
+
+    def _read_entry(self, f):
+        """Read an entry of the journal.
+
+        Returns:
+            the unpickled entry, or ``None`` if the entry is incomplete
+            or can not be unpickled.
+        """
+        size = f.read(8)
+        if len(size) < 8:
+            return None
+        size, = struct.unpack('<Q', size)
+        data = f.read(size)
+        if len(data) < size:
+            return None
+        try:
+            return cPickle.loads(data)
+        except Exception:
+            # E.g. a class that has been moved since the entry was
+            # written.
+            return None
+
+    def _stamp(self, fname):
+        """Get the values identifying the current state of a file."""
+        st = os.stat(fname)
+        return {'size': st.st_size, 'mtime': st.st_mtime}
+
+    def _write(self, obj):
+        """Append an object to the journal and flush it to disk."""
+        data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+        self.file.write(struct.pack('<Q', len(data)))
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def load(self, query, fname):
+        """Get the results of a finished file.
+
+        :param query: the query, which must be the query of the journal.
+        :param fname: filename of the sequence file.
+        :returns: the results, or ``None`` if the file is not finished.
+        """
+        if query != self.query:
+            return None
+        results = self.done.get(fname)
+        if instrument.enabled:
+            instrument.cache_lookup('checkpoint', fname, results is not None)
+        return results
+
+    def store(self, query, fname, results):
+        """Record the results of a finished file.
+
+        :param query: the query, which must be the query of the journal.
+        :param fname: filename of the sequence file.
+        :param results: a picklable object.
+        :returns: True if the results were written.
+        :raises: ValueError if the query is not the query of the journal.
+        """
+        if query != self.query:
+            raise ValueError('the checkpoint is for another search')
+        self._write((fname, self._stamp(fname), results))
+        self.done[fname] = results
+        return True
+
+    def close(self):
+        """Close the journal."""
+        self.file.close()
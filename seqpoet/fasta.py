@@ -6,16 +6,25 @@ FASTA index files.
 .. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
 """
 
-import collections
+import array
+import hashlib
 import itertools
 import os
-import textwrap
+import sys
+import time
 
+from seqpoet import instrument
+from seqpoet.bgzf import is_bgzf, is_gzip, open_file
 from seqpoet.sequence import Sequence
 
 class FastaIndex(object):
     """Represents an index for a FASTA file.
 
+    The index is stored column-wise, with the sequence names in a list
+    and the numeric fields in parallel arrays, together with a
+    dictionary from sequence name to position. Records can thus be
+    looked up both by position and by name in constant time.
+
     :param fname: filename of the FASTA file.
     """
 
@@ -26,28 +35,51 @@ class FastaIndex(object):
             fname: filename of the FASTA index
         """
         self.filename = fname
+        self.names = []
+        self.lengths = array.array('l')
+        self.offsets = array.array('l')
+        self.nbases = array.array('l')
+        self.linelens = array.array('l')
+        self.checksums = []
+        self.positions = {}
+        if instrument.enabled:
+            instrument.cache_lookup('fai', fname, os.path.isfile(fname))
         if not os.path.isfile(fname):
-            self.index = self.create_index()
+            with instrument.timer('FastaIndex.create_index'):
+                self.create_index()
         else:
-            self.index = self.parse_index()
+            self.parse_index()
+
+    def _add(self, name, length, offset, nbase, linelen, checksum=None):
+        """Append an entry to the index.
+
+        :raises: ValueError if the name is already in the index.
+        """
+        if name in self.positions:
+            raise ValueError('fasta contains duplicate headers')
+        self.positions[name] = len(self.names)
+        self.names.append(name)
+        self.lengths.append(length)
+        self.offsets.append(offset)
+        self.nbases.append(nbase)
+        self.linelens.append(linelen)
+        self.checksums.append(checksum)
 
     def parse_index(self):
         """Parse a FASTA index file to match the format of samtools faidx.
 
-        :returns:
-            an OrderedDict with sequence names (headers) as keys and
-            dicts as values. The value dicts have the following members:
+        Every line of the file gives an entry with the following members:
 
             - name:    the sequence name (FASTA header line)
             - length:  sequence length
             - offset:  the byte offset of the first base of the sequence
             - nbase:   number of bases per line of sequence
             - linelen: number of bytes per line of sequence
+
         :raises:
             ValueError if the file cannot be parsed, if the file contains
             duplicated headers or if the file is empty.
         """
-        index = collections.OrderedDict()
         with open(self.filename) as f:
             for line in f:
                 line = line.strip().split('\t')
@@ -55,24 +87,20 @@ class FastaIndex(object):
                     length, offset, linenbase, linelen = map(int, line[1:])
                 except:
                     raise ValueError('index file of incorrect format')
-                name = line[0]
-                if name in index:
-                    raise ValueError('fasta contains duplicate headers')
-                index[name] = {'name': name, 'length': length,
-                    'offset': offset, 'nbase': linenbase, 'linelen': linelen}
-        if len(index) == 0:
+                self._add(line[0], length, offset, linenbase, linelen)
+        if len(self.names) == 0:
             raise ValueError('fasta index is empty')
-        return index
 
     def create_index(self):
         """Generate a FASTA index from a FASTA file.
 
         This function assumes that the fasta index filename in the constructor
         has a corresponding FASTA file without the ".fai" (or any other)
-        extension.
+        extension. The entries are the same as those read by
+        :py:meth:`parse_index`, and the MD5 checksum of each sequence is
+        stored in :py:attr:`checksums`. An index read from a file has no
+        checksums, since they are not part of the format.
 
-        :returns:
-            see parse_index
         :raises:
             ValueError if the FASTA file contains duplicate headers,
             if the FASTA file has sequence entries where lines have different
@@ -80,9 +108,8 @@ class FastaIndex(object):
             an otherwise invalid FASTA file.
         """
         fasta_fname = os.path.splitext(self.filename)[0]
-        index = collections.OrderedDict()
         header_offset = 0
-        with open(fasta_fname) as f:
+        with open_file(fasta_fname) as f:
             while True:
                 line = f.readline()
                 if not line:
@@ -93,59 +120,72 @@ class FastaIndex(object):
                     header = line[1:].strip()
                     linelens = []
                     baselens = []
+                    checksum = hashlib.md5()
                     offset = f.tell()
                     line = f.readline()
                     while len(line) > 0 and line[0] != '>':
                         linelens.append(len(line))
                         baselens.append(len(line.strip()))
+                        checksum.update(line.strip().lower())
                         header_offset = f.tell()
                         line = f.readline()
-                    if header in index:
-                        raise ValueError('fasta contains duplicate headers')
                     if len(linelens) > 0:
                         if not all(x == linelens[0] for x in linelens[:-1]) \
                                 or not all(x == baselens[0] for x in baselens[:-1]):
                             raise ValueError('fasta has lines of different '
                                              'length for the same sequence: '
                                              '{0}'.format(header))
-                        index[header] = {
-                            'name': header, 'length': sum(baselens),
-                            'offset': offset,
-                            'nbase': baselens[0],
-                            'linelen': linelens[0]
-                        }
+                        self._add(header, sum(baselens), offset, baselens[0],
+                            linelens[0], checksum.hexdigest())
                     else:
                         # In case of empty sequence
                         header_offset = offset
-                        index[header] = {
-                            'name': header, 'length': sum(baselens),
-                            'offset': offset,
-                            'nbase': 0,
-                            'linelen': 0
-                        }
+                        self._add(header, 0, offset, 0, 0,
+                            checksum.hexdigest())
                 else:
                     raise ValueError('invalid FASTA file')
                 f.seek(header_offset)
-        return index
+
+    def get_position(self, name):
+        """Get the position of a sequence in the index.
+
+        :param name: the sequence name.
+        :returns: the position of the sequence.
+        :raises: KeyError if there is no sequence with that name.
+        """
+        return self.positions[name]
 
     def keys(self):
-        return self.index.keys()
+        return list(self.names)
 
     def __len__(self):
-        return len(self.index)
+        return len(self.names)
 
     def __getitem__(self, key):
-        return self.index[self.index.keys()[key]]
+        if isinstance(key, basestring):
+            key = self.positions[key]
+        return {
+            'name': self.names[key],
+            'length': self.lengths[key],
+            'offset': self.offsets[key],
+            'nbase': self.nbases[key],
+            'linelen': self.linelens[key],
+            'checksum': self.checksums[key]
+        }
+
+    def __contains__(self, name):
+        return name in self.positions
 
     def __iter__(self):
-        return self.index.iteritems()
+        for i, name in enumerate(self.names):
+            yield name, self[i]
 
     def __repr__(self):
         return '<FastaIndex for {0}>'.format(os.path.splitext(self.filename)[0])
 
     def __str__(self):
         return '\n'.join('{name}\t{length}\t{offset}\t{nbase}\t{linelen}'
-            .format(**x) for x in self.index.itervalues())
+            .format(**x) for k, x in self)
 
 class FastaRecord(object):
     """Represent a FASTA record.
@@ -182,47 +222,312 @@ class FastaRecord(object):
 
     def __str__(self):
         return '>{header}\n{seq}'.format(header=self.name,
-            seq='\n'.join(textwrap.wrap(str(self.seq), 70)))
+            seq='\n'.join(wrap(str(self.seq), 70)))
+
+def wrap(seq, width=70):
+    """Split a sequence into lines of a fixed width.
+
+    :param seq: a string.
+    :param width: the number of characters per line.
+    :returns: a list of strings of length ``width``, except for the last
+              one which may be shorter.
+    """
+    return [seq[i:i + width] for i in xrange(0, len(seq), width)]
+
+class FastaWriter(object):
+    """Write FASTA records to a file.
+
+    The sequences are wrapped by slicing them into lines of a fixed
+    width, and the output is collected in a buffer that is written in
+    large blocks. If ``index`` is set, a FASTA index in the format of
+    samtools faidx is written to FILE.fai when the writer is closed.
+    The writer can be used as a context manager.
+
+    :param fname: filename of the output file or an open file object.
+    :param width: the number of bases per line.
+    :param index: whether to write a FASTA index.
+    :param bufsize: the number of bytes to collect before writing.
+    :raises: ValueError if ``index`` is set and ``fname`` is not a
+             filename.
+    """
+
+    def __init__(self, fname, width=70, index=False, bufsize=1 << 20):
+        if isinstance(fname, basestring):
+            self.filename = fname
+            self.file = open(fname, 'w')
+            self._close = True
+        else:
+            if index:
+                raise ValueError('a FASTA index can only be written next '
+                    'to a named file')
+            self.filename = getattr(fname, 'name', None)
+            self.file = fname
+            self._close = False
+        self.width = width
+        self.bufsize = bufsize
+        self.index = [] if index else None
+        self._buffer = []
+        self._buffered = 0
+        self._offset = 0
+
+    def write(self, record):
+        """Write a record.
+
+        :param record: a :py:class:`FastaRecord` object.
+        """
+        header = '>{0}\n'.format(record.name)
+        seq = str(record.seq)
+        lines = wrap(seq, self.width)
+        body = '\n'.join(lines) + '\n' if len(lines) > 0 else ''
+        if self.index is not None:
+            # As in samtools faidx, a sequence that fits on one line
+            # has the length of that line.
+            nbase = min(self.width, len(seq))
+            linelen = nbase + 1 if nbase > 0 else 0
+            self.index.append((record.name, len(seq),
+                self._offset + len(header), nbase, linelen))
+        self._buffer.append(header)
+        self._buffer.append(body)
+        size = len(header) + len(body)
+        self._offset += size
+        self._buffered += size
+        if self._buffered >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        self.file.write(''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        """Flush the buffer, write the index and close the file.
+
+        A file object that was passed to the writer is flushed but not
+        closed.
+        """
+        self.flush()
+        if self._close:
+            self.file.close()
+        else:
+            self.file.flush()
+        if self.index is not None:
+            with open(self.filename + '.fai', 'w') as f:
+                for entry in self.index:
+                    f.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(*entry))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class FastaReader(object):
+    """Read the records of a FASTA file in a single forward pass.
+
+    Unlike :py:class:`Fasta`, no index is needed, the file is read in
+    large blocks and it is never seeked, so the reader also works on
+    pipes and standard input. Gzip and BGZF compressed files are
+    decompressed while they are read. A reader of a named file can be
+    iterated over several times, but a stream can only be read once.
+
+    :param fname: filename of the FASTA file, '-' for standard input or
+                  an open file object.
+    :param bufsize: the number of bytes to read at a time.
+    :raises: ValueError if a named file does not start with a FASTA
+             header.
+    """
+
+    def __init__(self, fname, bufsize=1 << 20):
+        if fname == '-':
+            fname = sys.stdin
+        if isinstance(fname, basestring):
+            self.filename = fname
+            self.stream = None
+            with open_file(fname) as f:
+                for line in f:
+                    if len(line.strip()) > 0:
+                        break
+                else:
+                    line = ''
+            if not line.startswith('>'):
+                raise ValueError('invalid FASTA file')
+        else:
+            self.filename = getattr(fname, 'name', '-')
+            self.stream = fname
+        self.bufsize = bufsize
+        self._length = None
+
+    def _lines(self, f):
+        """Generate the lines of a file, read in blocks."""
+        rest = ''
+        while True:
+            block = f.read(self.bufsize)
+            if not block:
+                break
+            if instrument.enabled:
+                instrument.emit('bytes_read', len(block),
+                    filename=self.filename)
+            lines = (rest + block).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
+    def _records(self, f):
+        name = None
+        parts = []
+        names = set()
+        for line in self._lines(f):
+            if line.startswith('>'):
+                if name is not None:
+                    if instrument.enabled:
+                        self._loaded(name, parts)
+                    yield FastaRecord(Sequence(''.join(parts)), name)
+                name = line[1:].strip()
+                if name in names:
+                    raise ValueError('fasta contains duplicate headers')
+                names.add(name)
+                parts = []
+            else:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                if name is None:
+                    raise ValueError('invalid FASTA file')
+                parts.append(line)
+        if name is not None:
+            if instrument.enabled:
+                self._loaded(name, parts)
+            yield FastaRecord(Sequence(''.join(parts)), name)
+
+    def _loaded(self, name, parts):
+        """Report a parsed record to :py:mod:`.instrument`."""
+        instrument.emit('record_loaded', filename=self.filename, name=name,
+            length=sum(len(x) for x in parts))
+
+    def __iter__(self):
+        """Generate the records of the file.
+
+        :returns: a FastaRecord generator.
+        :raises: ValueError if the file contains duplicate headers,
+                 sequence before the first header or invalid bases.
+        """
+        if self.stream is not None:
+            for record in self._records(self.stream):
+                yield record
+            return
+        with open_file(self.filename) as f:
+            for record in self._records(f):
+                yield record
+
+    def __len__(self):
+        """Count the records of the file.
+
+        The headers of a named file are counted the first time, without
+        parsing the sequences.
+
+        :raises: TypeError if the file is a stream.
+        """
+        if self.stream is not None:
+            raise TypeError('the number of records in a stream is unknown')
+        if self._length is None:
+            with open_file(self.filename) as f:
+                self._length = sum(line.startswith('>') \
+                    for line in self._lines(f))
+        return self._length
+
+    def __repr__(self):
+        return '<FastaReader for {0}>'.format(self.filename)
 
 class Fasta(object):
-    """Represent a FASTA file."""
+    """Represent a FASTA file.
 
-    def __init__(self, fname):
+    The file can be BGZF compressed, in which case the offsets of the
+    FASTA index refer to the uncompressed data, as in ``samtools
+    faidx``, and the blocks are found through a FILE.gzi index.
+
+    :param fname: filename of the FASTA file.
+    :param index: a :py:class:`FastaIndex` of the file, e.g. one stored
+                  earlier. If ``None``, the index is read from FILE.fai or
+                  created.
+    :raises: ValueError if the file is gzip compressed but not BGZF
+             compressed, since that does not allow random access.
+    """
+
+    def __init__(self, fname, index=None):
         """Fasta constructor.
 
         Args:
             fname: filename of the FASTA file
+            index: FastaIndex of the file, or None to read or create it
         """
         self.filename = fname
-        self.index = FastaIndex(self.filename + '.fai')
+        if is_gzip(fname) and not is_bgzf(fname):
+            raise ValueError('random access to a gzip compressed FASTA file '
+                'requires BGZF compression (bgzip): {0}'.format(fname))
+        if index is None:
+            index = FastaIndex(self.filename + '.fai')
+        self.index = index
 
     def get_record(self, key):
         """Get a single FASTA record.
 
         :param key: an integer.
         :returns: the FastaRecord stored at key.
+        :raises: IndexError if there is no record at key.
         """
+        timing = instrument.enabled
+        if timing:
+            start_time = time.time()
         indexdict = self.index[key]
         if indexdict['length'] == 0:
             return FastaRecord(Sequence(''), indexdict['name'])
         seq = ''
-        with open(self.filename) as f:
+        with open_file(self.filename) as f:
             f.seek(indexdict['offset'])
             ncompletelines = indexdict['length'] // indexdict['nbase']
             ncompletebytes = ncompletelines * indexdict['linelen']
             for lineno in xrange(ncompletelines):
                 seq += f.read(indexdict['linelen']).strip()
-            restbytes = indexdict['length'] % len(seq)
+            restbytes = indexdict['length'] - len(seq)
             seq += f.read(restbytes).strip()
+            nbytes = f.tell() - indexdict['offset']
+        if timing:
+            instrument.add_time('Fasta.get_record', time.time() - start_time)
+            instrument.emit('bytes_read', nbytes, filename=self.filename)
+            instrument.emit('record_loaded', filename=self.filename,
+                name=indexdict['name'], length=len(seq))
         return FastaRecord(Sequence(seq), indexdict['name'])
 
+    def checksum(self, key):
+        """Get the checksum of the sequence of a record.
+
+        :param key: an integer.
+        :returns: the checksum as a hexadecimal string, or ``None`` if
+                  the index was read from a FASTA index file.
+        """
+        return self.index.checksums[key]
+
+    def get_record_by_name(self, name):
+        """Get a single FASTA record by its name.
+
+        :param name: the name (FASTA header) of the record.
+        :returns: the FastaRecord with that name.
+        :raises: KeyError if there is no record with that name.
+        """
+        return self.get_record(self.index.get_position(name))
+
     def generate_records(self):
         """FastaRecord generator.
 
+        The records are read in a single pass over the file with a
+        :py:class:`FastaReader`.
+
         :returns: a FastaRecord generator.
         """
-        for i in xrange(len(self.index)):
-            yield self.get_record(i)
+        return iter(FastaReader(self.filename))
 
     def __getitem__(self, key):
         return self.get_record(key)
@@ -0,0 +1,178 @@
+#-*- encoding: utf-8 -*-
+"""FM-indexes for searching a sequence many times without scanning it.
+
+.. module:: fmindex
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import array
+import collections
+import functools
+
+from seqpoet.cache import load_sidecar, save_sidecar
+
+def suffix_array(text, k=8):
+    """Build the suffix array of a string.
+
+    The suffixes are put in buckets on their first ``k`` characters,
+    with the positions of each bucket in an integer array. The buckets
+    are then sorted one at a time, comparing the suffixes as buffers
+    of the string, so that the comparisons are done in C and only the
+    suffixes of one bucket are Python objects at any time. Building the
+    suffix array of a 5 Mb genome takes about 10 s and 100 MB of
+    memory. Very long runs of a single character, e.g. of N in a
+    scaffold, make the comparisons slower, since they scan the run.
+
+    :param text: a string.
+    :param k: the length of the prefixes of the buckets.
+    :returns: an ``array.array`` with the start positions of the
+              suffixes of ``text`` in lexicographical order.
+    """
+    buckets = collections.defaultdict(functools.partial(array.array, 'l'))
+    for i in xrange(len(text)):
+        buckets[text[i:i + k]].append(i)
+    sa = array.array('l')
+    for prefix in sorted(buckets):
+        positions = buckets.pop(prefix)
+        if len(positions) > 1:
+            positions = sorted(positions, key=lambda i: buffer(text, i))
+        sa.extend(positions)
+    return sa
+
+class FMIndex(object):
+
+    """Represent an FM-index of a DNA sequence.
+
+    The index consists of the Burrows-Wheeler transform (BWT) of the
+    sequence, the number of occurrences of each base in the BWT at
+    every ``occ_step`` position and the suffix array entries that are
+    multiples of ``sa_step``. The sequence itself is not stored.
+
+    **Class attributes:**
+
+        - **bwt:** the Burrows-Wheeler transform of the sequence, with
+          '$' marking the end of the sequence.
+        - **alphabet:** the sorted bases present in the sequence.
+
+    :param seq: a :py:class:`.Sequence` object or a string.
+    :param occ_step: the distance between the stored occurrence counts.
+    :param sa_step: the distance between the stored sequence positions.
+    """
+
+    def __init__(self, seq, occ_step=64, sa_step=32):
+        text = str(seq) + '$'
+        self.occ_step = occ_step
+        self._length = len(text) - 1
+
+        sa = suffix_array(text)
+        self.bwt = ''.join(text[i - 1] for i in sa)
+        self.alphabet = sorted(set(text) - set('$'))
+
+        # C[x] is the number of characters in the sequence, including
+        # the terminator, that are smaller than x.
+        self._c = {}
+        total = 1
+        for x in self.alphabet:
+            self._c[x] = total
+            total += self.bwt.count(x)
+
+        self._occ = {}
+        for x in self.alphabet:
+            counts = array.array('l', [0])
+            for i in xrange(0, len(self.bwt), occ_step):
+                counts.append(counts[-1] + self.bwt.count(x, i, i + occ_step))
+            self._occ[x] = counts
+
+        self._samples = dict((row, pos) for row, pos in enumerate(sa) \
+            if pos % sa_step == 0)
+
+    def _rank(self, x, row):
+        """Get the number of occurrences of x in the BWT before row."""
+        i = row // self.occ_step
+        return self._occ[x][i] + self.bwt.count(x, i * self.occ_step, row)
+
+    def _locate(self, row):
+        """Get the sequence position of the suffix at a row."""
+        steps = 0
+        while row not in self._samples:
+            x = self.bwt[row]
+            row = self._c[x] + self._rank(x, row)
+            steps += 1
+        return self._samples[row] + steps
+
+    def find(self, needle, mismatches=0):
+        """Find all occurrences of a needle in the sequence.
+
+        The needle is matched from its last base to its first, and
+        every base of the alphabet is tried at each position as long as
+        no more than ``mismatches`` mismatches have been used, so the
+        search time grows quickly with the number of mismatches.
+
+        :param needle: a :py:class:`.Sequence` object or a string.
+        :param mismatches: the maximum number of mismatches allowed.
+        :returns: a sorted integer list with the starting positions of
+                  the matches.
+        """
+        needle = str(needle)
+        rows = []
+        stack = [(len(needle), 0, len(self.bwt), 0)]
+        while len(stack) > 0:
+            i, lo, hi, mm = stack.pop()
+            if i == 0:
+                rows.append((lo, hi))
+                continue
+            base = needle[i - 1]
+            for x in self.alphabet:
+                cost = mm + (x != base)
+                if cost > mismatches:
+                    continue
+                new_lo = self._c[x] + self._rank(x, lo)
+                new_hi = self._c[x] + self._rank(x, hi)
+                if new_lo < new_hi:
+                    stack.append((i - 1, new_lo, new_hi, cost))
+        return sorted(self._locate(row) for lo, hi in rows \
+            for row in xrange(lo, hi))
+
+    def search(self, needle, mismatches=0):
+        """Search for the occurence of a needle in the sequence.
+
+        :param needle: a :py:class:`.Sequence` object or a string.
+        :param mismatches: the maximum number of mismatches allowed.
+        :returns: the same integer list as
+                  :py:func:`seqpoet.search.search` gives for the
+                  sequence.
+        """
+        last = self._length - len(needle)
+        return [x for x in self.find(needle, mismatches) if x < last]
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<FMIndex of length {0}>'.format(self._length)
+
+def genome_index(seqfile, suffix='.fmi', occ_step=64, sa_step=32):
+    """Get the FM-indexes of the records in a sequence file.
+
+    The indexes are stored in a sidecar file next to the sequence file
+    and are built only if the sidecar is missing, was built with other
+    sampling distances or is older than the sequence file. If the
+    sidecar cannot be written, the indexes are still returned.
+
+    :param seqfile: a :py:class:`.GenBank`, :py:class:`.Fasta` or
+                    similar object with a ``filename`` attribute that
+                    iterates over records.
+    :param suffix: the suffix of the sidecar file.
+    :param occ_step: the distance between the stored occurrence counts.
+    :param sa_step: the distance between the stored sequence positions.
+    :returns: a list of :py:class:`.FMIndex` objects, one per record.
+    """
+    params = (occ_step, sa_step)
+    indexes = load_sidecar(seqfile.filename, suffix, params)
+    if indexes is not None:
+        return indexes
+
+    indexes = [FMIndex(record.seq, occ_step, sa_step) for record in seqfile]
+    save_sidecar(seqfile.filename, suffix, indexes, params)
+
+    return indexes
@@ -5,10 +5,21 @@
 .. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
 """
 
+import array
+import bisect
 import collections
+import contextlib
+import gzip
+import hashlib
 import itertools
+import os
 import re
+import shutil
+import tempfile
+import time
 
+from seqpoet import instrument
+from seqpoet.bgzf import is_bgzf, is_gzip, open_file
 from seqpoet.sequence import Sequence
 
 class LocationError(Exception):
@@ -439,6 +450,8 @@ class GenBankLocus(object):
             self.header = {}
         else:
             self.header = header
+        self._feature_lookup = {}
+        self._operon_blocks = {}
 
     def features_at_location(self, location):
         """Get features at a location.
@@ -461,6 +474,144 @@ class GenBankLocus(object):
                     features.append(feature)
         return features
 
+    def _overlapping(self, feature_type, location):
+        """Get indices of features of a type overlapping a location.
+
+        The first call for a feature type sorts the features by start
+        position and stores a running maximum of the end positions,
+        which makes it possible to narrow the candidates down with two
+        binary searches.
+
+        Args:
+            feature_type: the feature key to search.
+            location: a Location or JoinLocation object.
+        Returns:
+            a list of indices into ``self.features[feature_type]``.
+        """
+        if feature_type not in self._feature_lookup:
+            features = self.features[feature_type]
+            order = sorted(xrange(len(features)),
+                key=lambda i: features[i].location.start)
+            starts = []
+            max_ends = []
+            max_end = None
+            for i in order:
+                starts.append(features[i].location.start)
+                max_end = max(max_end, features[i].location.end)
+                max_ends.append(max_end)
+            self._feature_lookup[feature_type] = (order, starts, max_ends)
+
+        order, starts, max_ends = self._feature_lookup[feature_type]
+        features = self.features[feature_type]
+        lo = bisect.bisect_left(max_ends, location.start)
+        hi = bisect.bisect_right(starts, location.end)
+        return [i for i in order[lo:hi] \
+            if features[i].location.overlaps(location)]
+
+    def operons(self, feature_type, max_distance=500):
+        """Segment the features of a type into operons.
+
+        Features are split into operons by a single sweep over each
+        strand in order of start position. A feature belongs to the
+        same operon as the previous feature on the strand if the
+        intergenic distance between them is less than ``max_distance``.
+        The segmentation is computed once per feature type and distance.
+
+        :param feature_type: the feature key to segment, e.g. 'CDS'.
+        :param max_distance: the maximum intergenic distance allowed
+                             within an operon.
+        :returns: a list of operons where each operon is a list of
+                  :py:class:`.GenBankFeature` objects on the same strand
+                  sorted by start position.
+        """
+        return self._segment(feature_type, max_distance)[0]
+
+    def _segment(self, feature_type, max_distance):
+        """Segment features into operons.
+
+        Returns:
+            a 2-tuple with a list of operons and a list with the operon
+            index of each feature in ``self.features[feature_type]``.
+        """
+        key = (feature_type, max_distance)
+        if key in self._operon_blocks:
+            return self._operon_blocks[key]
+
+        features = self.features.get(feature_type, [])
+        order = sorted(xrange(len(features)),
+            key=lambda i: features[i].location.start)
+        blocks = []
+        block_index = [None] * len(features)
+        for is_complement in (False, True):
+            block_end = None
+            for i in order:
+                location = features[i].location
+                if location.is_complement != is_complement:
+                    continue
+                if block_end is None or \
+                        location.start - block_end >= max_distance:
+                    blocks.append([])
+                    block_end = location.end
+                blocks[-1].append(features[i])
+                block_index[i] = len(blocks) - 1
+                block_end = max(block_end, location.end)
+
+        self._operon_blocks[key] = (blocks, block_index)
+        return blocks, block_index
+
+    def operon_at_location(self, location, max_distance=500):
+        """Get the operon overlapping a location.
+
+        All features except the source feature that overlap
+        ``location`` and are on the same strand as ``location`` are
+        looked up in the operon segmentation of their feature type
+        (see :py:meth:`.operons`), and the genes of all operons found
+        are returned together.
+
+        An operon is considered to reach the edge of the sequence if
+        its outermost gene is closer than ``max_distance`` to the end
+        of the sequence. Upstream and downstream are relative to the
+        strand of ``location``.
+
+        :param location: a :py:class:`.Location` object. Use a complement
+                         location to search the reverse strand.
+        :param max_distance: the maximum intergenic distance allowed
+                             within an operon.
+        :returns: a 3-tuple with a list of :py:class:`.GenBankFeature`
+                  objects sorted by start position, and two booleans
+                  indicating whether the operon reaches the sequence
+                  edge upstream and downstream, respectively. The list
+                  is empty if no features overlap the location.
+        """
+        genes = []
+        low_edge = False
+        high_edge = False
+        for ftype in self.features:
+            if ftype == 'source':
+                continue
+            blocks, block_index = self._segment(ftype, max_distance)
+            seen = set()
+            for i in self._overlapping(ftype, location):
+                feature = self.features[ftype][i]
+                if feature.location.is_complement != location.is_complement:
+                    continue
+                if block_index[i] in seen:
+                    continue
+                seen.add(block_index[i])
+                block = blocks[block_index[i]]
+                genes.extend(block)
+                if block[0].location.start < max_distance:
+                    low_edge = True
+                if len(self.seq) - max(x.location.end for x in block) < \
+                        max_distance:
+                    high_edge = True
+
+        genes.sort(key=lambda x: x.location.start)
+
+        if location.is_complement:
+            return genes, high_edge, low_edge
+        return genes, low_edge, high_edge
+
     def next_upstream(self, feature):
         """Get a neighboring feature upstream of ``feature``.
 
@@ -548,6 +699,13 @@ class GenBank(object):
 
     """Represent a GenBank file.
 
+    The file can be gzip or BGZF compressed. A BGZF compressed file is
+    read block by block, while other gzip compressed files are
+    decompressed to a temporary file while they are being read, see
+    :py:meth:`open`. Iterating over the loci keeps the temporary file
+    for the whole iteration, while a single locus read with
+    :py:meth:`__getitem__` decompresses the file again.
+
     **Class attributes:**
 
         - filename: the filename of the GenBank file.
@@ -564,7 +722,84 @@ class GenBank(object):
             fname: filename of the GenBank file.
         """
         self.filename = fname
-        self.index, self.features = self._index()
+        self._tempname = None
+        self._nopen = 0
+        self._pid = os.getpid()
+        # The parser seeks back and forth, which is only fast in
+        # uncompressed or BGZF compressed data.
+        self._decompress = is_gzip(fname) and not is_bgzf(fname)
+        with instrument.timer('GenBank._index'):
+            self.index, self.features = self._index()
+
+    def open(self):
+        """Prepare the file for reading several loci.
+
+        A gzip compressed file that is not BGZF compressed is decompressed
+        to a temporary file, which is used until the matching call to
+        :py:meth:`close`. Calls can be nested. Other files are read
+        directly, and for them this does nothing.
+
+        :raises: :py:exc:`.ParsingError` if the file does not look like a
+                 GenBank file.
+        """
+        if self._decompress and self._nopen == 0:
+            with gzip.open(self.filename) as f:
+                if not f.readline().strip().startswith('LOCUS'):
+                    raise ParsingError('does not look like a GenBank '
+                        'file: {0}'.format(self.filename))
+                f.seek(0)
+                fd, tempname = tempfile.mkstemp(suffix='.gb',
+                    prefix='seqpoet')
+                try:
+                    with os.fdopen(fd, 'wb') as out:
+                        shutil.copyfileobj(f, out)
+                except:
+                    os.remove(tempname)
+                    raise
+            self._tempname = tempname
+        self._nopen += 1
+
+    def close(self):
+        """End reading started by :py:meth:`open`.
+
+        The temporary file of a gzip compressed file is removed when the
+        outermost call to :py:meth:`open` is closed.
+        """
+        if self._nopen == 0:
+            return
+        self._nopen -= 1
+        if self._nopen == 0:
+            self._remove_tempfile()
+
+    def _remove_tempfile(self):
+        # Copies of the object in forked processes leave the file alone.
+        if self._tempname is not None and os.getpid() == self._pid:
+            if os.path.exists(self._tempname):
+                os.remove(self._tempname)
+        self._tempname = None
+
+    @contextlib.contextmanager
+    def _open(self):
+        """Open the GenBank file for reading.
+
+        Returns:
+            a context manager giving a file-like object supporting seek
+            and tell on positions in the uncompressed data.
+        """
+        self.open()
+        try:
+            if self._tempname is not None:
+                f = open(self._tempname)
+            else:
+                f = open_file(self.filename)
+            with f:
+                yield f
+        finally:
+            self.close()
+
+    def __del__(self):
+        if getattr(self, '_tempname', None) is not None:
+            self._remove_tempfile()
 
     def _index(self):
         """Create and index of a the GenBank object.
@@ -576,7 +811,8 @@ class GenBank(object):
         features = set()
         indexdicts = []
         in_features = False
-        with open(self.filename) as f:
+        checksum = None
+        with self._open() as f:
             offset = 0
             for lineno, line in enumerate(f):
                 if lineno == 0 and not line.strip().startswith('LOCUS'):
@@ -586,6 +822,15 @@ class GenBank(object):
                 if len(line.strip()) == 0:
                     offset += len(line)
                     continue
+                if checksum is not None:
+                    # Sequence lines only need to go into the checksum.
+                    if line.strip() == '//':
+                        indexdicts[-1]['checksum'] = checksum.hexdigest()
+                        checksum = None
+                    else:
+                        checksum.update(''.join(line.split()[1:]).lower())
+                        offset += len(line)
+                        continue
                 if line.strip().split()[0] == 'LOCUS':
                     current_locus = line.strip().split()[1]
                     indexdicts.append({})
@@ -594,6 +839,7 @@ class GenBank(object):
                 if line.strip().split()[0] == 'ORIGIN':
                     indexdicts[-1]['ORIGIN'] = offset + len(line)
                     in_features = False
+                    checksum = hashlib.md5()
                 if in_features and line[5] != ' ':
                     feature = line.strip().split()[0]
                     features.add(feature)
@@ -722,12 +968,110 @@ class GenBank(object):
 
         return head_data
 
+    def _read_feature_string(self, f, offset):
+        """Read the string representing a single feature.
+
+        Args:
+            f: an open file handle for the GenBank file.
+            offset: the byte offset of the first line of the feature.
+        Returns:
+            the feature string, including the feature key, the location
+            and any qualifiers.
+        """
+        f.seek(offset)
+        feature_string = f.readline()
+        line = f.readline()
+        while len(line) < 6:
+            line = f.readline()
+        while line[5] == ' ':
+            feature_string += line
+            line = f.readline()
+            while len(line) < 6:
+                line = f.readline()
+        return feature_string
+
+    def feature_table(self, types=None, qualifiers=()):
+        """Get the features of all loci as a column oriented table.
+
+        The table is built directly from the index of the file, so no
+        :py:class:`.GenBankLocus` objects are created. Feature strings
+        are only read from the file if ``qualifiers`` are requested.
+        Within each locus, the features are sorted by start position.
+
+        The table is an ``OrderedDict`` with the following columns:
+
+            - **locus:** index of the locus in the file.
+            - **type:** the feature key, e.g. 'CDS' or 'tRNA'.
+            - **start:** the start position (0-based, including).
+            - **end:** the end position (0-based, including).
+            - **strand:** '+' or '-'.
+
+        and one additional column per requested qualifier, holding
+        ``None`` for features lacking that qualifier. Numeric columns
+        are :py:class:`array.array` objects and can be handed to
+        e.g. ``numpy.asarray`` without copying element by element.
+
+        :param types: an iterable of feature keys to include. If
+                      ``None``, all feature types are included.
+        :param qualifiers: an iterable of qualifier names to include
+                           as columns.
+        :returns: an ``OrderedDict`` with column names as keys and
+                  columns as values.
+        """
+        if types is None:
+            types = sorted(self.features)
+        else:
+            types = [x for x in types if x in self.features]
+        qualifiers = list(qualifiers)
+
+        table = collections.OrderedDict([
+            ('locus', array.array('l')),
+            ('type', []),
+            ('start', array.array('l')),
+            ('end', array.array('l')),
+            ('strand', array.array('c'))
+        ])
+        for qualifier in qualifiers:
+            table[qualifier] = []
+
+        with self._open() as f:
+            for i, locus_index in enumerate(self.index):
+                entries = []
+                for ftype in types:
+                    if ftype not in locus_index:
+                        continue
+                    for feature in locus_index[ftype]:
+                        entries.append((feature['location'].start, ftype,
+                            feature))
+                entries.sort(key=lambda x: x[:2])
+
+                for start, ftype, feature in entries:
+                    location = feature['location']
+                    table['locus'].append(i)
+                    table['type'].append(ftype)
+                    table['start'].append(location.start)
+                    table['end'].append(location.end)
+                    table['strand'].append(
+                        '-' if location.is_complement else '+')
+                    if len(qualifiers) == 0:
+                        continue
+                    gbf = GenBankFeature.from_string(locus_index['name'],
+                        self._read_feature_string(f, feature['offset']))
+                    for qualifier in qualifiers:
+                        table[qualifier].append(
+                            gbf.qualifiers.get(qualifier))
+
+        return table
+
     def __getitem__(self, index):
         """Get a specific GenBankLocus object.
 
         :param index: the index of the wanted locus in the index.
         :returns: a GenBankLocus object.
         """
+        timing = instrument.enabled
+        if timing:
+            start_time = time.time()
         locus_index = self.index[index]
         locus_offset = locus_index['offset']
         origin_offset = locus_index['ORIGIN']
@@ -735,7 +1079,7 @@ class GenBank(object):
 
         headstring = ''
 
-        with open(self.filename) as f:
+        with self._open() as f:
             f.seek(locus_offset)
             headstring += f.readline()
 
@@ -750,16 +1094,8 @@ class GenBank(object):
                 if ftype not in locus_index:
                     continue
                 for feature in locus_index[ftype]:
-                    f.seek(feature['offset'])
-                    feature_string = f.readline()
-                    line = f.readline()
-                    while len(line) < 6:
-                        line = f.readline()
-                    while line[5] == ' ':
-                        feature_string += line
-                        line = f.readline()
-                        while len(line) < 6:
-                            line = f.readline()
+                    feature_string = self._read_feature_string(f,
+                        feature['offset'])
                     features[ftype].append(
                         GenBankFeature.from_string(locus_index['name'],
                             feature_string))
@@ -771,10 +1107,29 @@ class GenBank(object):
             while line.strip() != '//':
                 line = f.readline()
                 seq += ''.join(line.strip().split()[1:])
+            nbytes = f.tell() - locus_offset
+
+        if timing:
+            instrument.add_time('GenBank.__getitem__', time.time() - start_time)
+            instrument.emit('bytes_read', nbytes, filename=self.filename)
+            instrument.emit('record_loaded', filename=self.filename,
+                name=locus_index['name'], length=len(seq))
 
         return GenBankLocus(locus_index['name'], Sequence(seq), features,
             head_data)
 
+    def checksum(self, index):
+        """Get the checksum of the sequence of a locus.
+
+        The checksum is computed when the file is indexed, and is the
+        same as :py:meth:`.Sequence.checksum` gives for the sequence.
+
+        :param index: the index of the locus.
+        :returns: the checksum as a hexadecimal string, or ``None`` if
+                  the sequence of the locus is not terminated by '//'.
+        """
+        return self.index[index].get('checksum')
+
     def get_locus_from_name(self, name):
         """Get a specific GenBankLocus object from the locus name.
 
@@ -791,9 +1146,16 @@ class GenBank(object):
 
     def __iter__(self):
         """Iterate over the loci.
+
+        A gzip compressed file is decompressed once for the whole
+        iteration, see :py:meth:`open`.
         """
-        for i in xrange(len(self)):
-            yield self[i]
+        self.open()
+        try:
+            for i in xrange(len(self)):
+                yield self[i]
+        finally:
+            self.close()
 
     def __len__(self):
         return len(self.index)
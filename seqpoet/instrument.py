@@ -0,0 +1,170 @@
+#-*- encoding: utf-8 -*-
+"""Counters, timers and callbacks for measuring the library.
+
+Instrumentation is disabled by default, and then an instrumented call
+only costs a check of :py:data:`enabled`. When it is enabled with
+:py:func:`enable`, the instrumented functions add their running time
+to :py:data:`timers` and report events, which are summed in
+:py:data:`counters` and passed to the callbacks that have subscribed
+to them.
+
+The events are:
+
+    - **record_loaded:** a record was read from a sequence file. The
+      value is 1, and the keyword arguments are ``filename``, ``name``
+      and ``length``.
+    - **bytes_read:** data was read from a sequence file. The value is
+      the number of bytes, and the keyword argument is ``filename``.
+    - **window_scanned:** a range of start positions was searched. The
+      value is the number of positions, and the keyword arguments are
+      ``start`` and ``end``.
+    - **cache_hit** and **cache_miss:** a cache was or was not able to
+      answer a lookup. The value is 1, and the keyword arguments are
+      ``cache``, the name of the cache, and ``key``.
+
+For example, to count the bases searched by a pipeline::
+
+    from seqpoet import instrument
+
+    def report(event, value, **info):
+        metrics.increment('seqpoet.positions', value)
+
+    instrument.subscribe('window_scanned', report)
+    instrument.enable()
+
+.. module:: instrument
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import collections
+import contextlib
+import time
+
+#: Whether instrumentation is enabled.
+enabled = False
+
+#: The summed values of each event, and of the events of each cache
+#: as e.g. ``cache_hit:genome``.
+counters = collections.Counter()
+
+#: The total time in seconds spent in each timed function.
+timers = collections.Counter()
+
+#: The number of calls of each timed function.
+calls = collections.Counter()
+
+_callbacks = collections.defaultdict(list)
+
+def enable():
+    """Enable instrumentation."""
+    global enabled
+    enabled = True
+
+def disable():
+    """Disable instrumentation.
+
+    The counters and timers are kept, and so are the subscriptions.
+    """
+    global enabled
+    enabled = False
+
+def reset():
+    """Clear the counters and timers."""
+    counters.clear()
+    timers.clear()
+    calls.clear()
+
+def subscribe(event, callback):
+    """Call a function each time an event is reported.
+
+    :param event: the name of the event.
+    :param callback: a function that is called with the name of the
+                     event, its value and the keyword arguments of the
+                     event.
+    """
+    _callbacks[event].append(callback)
+
+def unsubscribe(event, callback):
+    """Stop calling a function for an event.
+
+    :param event: the name of the event.
+    :param callback: a function passed to :py:func:`subscribe`.
+    :raises: ValueError if the function is not subscribed to the event.
+    """
+    _callbacks[event].remove(callback)
+
+def emit(event, value=1, **info):
+    """Report an event.
+
+    Instrumented code only calls this when :py:data:`enabled` is True.
+
+    :param event: the name of the event.
+    :param value: the amount to add to the counter of the event.
+    :param info: keyword arguments passed to the callbacks.
+    """
+    counters[event] += value
+    if 'cache' in info:
+        counters['{0}:{1}'.format(event, info['cache'])] += value
+    for callback in _callbacks.get(event, ()):
+        callback(event, value, **info)
+
+def cache_lookup(cache, key, hit):
+    """Report a cache hit or miss.
+
+    :param cache: the name of the cache.
+    :param key: the key that was looked up, usually a filename.
+    :param hit: True if the cache had the entry.
+    """
+    emit('cache_hit' if hit else 'cache_miss', cache=cache, key=key)
+
+def add_time(name, seconds):
+    """Add the time of a call to a timer.
+
+    :param name: the name of the timer.
+    :param seconds: the time of the call.
+    """
+    timers[name] += seconds
+    calls[name] += 1
+
+@contextlib.contextmanager
+def timer(name):
+    """Time a block of code if instrumentation is enabled.
+
+    This is convenient for code that is not called often enough for
+    the check of :py:data:`enabled` to matter.
+
+    :param name: the name of the timer.
+    """
+    if not enabled:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_time(name, time.time() - start)
+
+def snapshot():
+    """Get the current counters and timers.
+
+    :returns: a dictionary with copies of :py:data:`counters`,
+              :py:data:`timers` and :py:data:`calls`.
+    """
+    return {
+        'counters': dict(counters),
+        'timers': dict(timers),
+        'calls': dict(calls)
+    }
+
+def merge(other):
+    """Add the counters and timers of a snapshot to the current ones.
+
+    This collects the measurements of other processes, e.g. of the
+    workers of a :py:class:`multiprocessing.Pool`. The callbacks are
+    not called for the events of the snapshot.
+
+    :param other: a dictionary as returned by :py:func:`snapshot`.
+    """
+    counters.update(other['counters'])
+    timers.update(other['timers'])
+    calls.update(other['calls'])
@@ -1,10 +1,14 @@
 #-*- encoding: utf-8 -*-
-"""Functions for searching for sequence matches.
+"""Functions and classes for searching for sequence matches.
 
 .. module:: search
 .. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
 """
 
+import time
+
+from seqpoet import instrument
+
 def search(needle, haystack, mismatches=0):
     """Search for the occurence of ``needle`` in ``haystack``.
 
@@ -13,14 +17,76 @@ def search(needle, haystack, mismatches=0):
     :param mismatches: the maximum number of mismatches allowed.
     :returns: an integer list with the starting positions of the matches.
     """
+    timing = instrument.enabled
+    if timing:
+        start_time = time.time()
     n = len(needle)
     matches = []
     for i in xrange(0, len(haystack) - n):
         hd = hamming_distance(needle, haystack[i:i + n], mismatches)
         if hd <= mismatches:
             matches.append(i)
+    if timing:
+        instrument.add_time('search.search', time.time() - start_time)
+        end = max(0, len(haystack) - n)
+        instrument.emit('window_scanned', end, start=0, end=end)
     return matches
 
+def search_windows(needle, haystack, windows, mismatches=0):
+    """Search for the occurence of ``needle`` within parts of ``haystack``.
+
+    Only start positions within ``windows`` are considered, and the
+    result is the same as the result of :py:func:`.search` restricted
+    to those positions.
+
+    :param needle: string to search for.
+    :param haystack: string to search in.
+    :param windows: an iterable of ``(start, end)`` tuples representing
+                    half-open ranges of start positions to try. The
+                    windows may overlap and need not be sorted.
+    :param mismatches: the maximum number of mismatches allowed.
+    :returns: a sorted integer list with the starting positions of the
+              matches.
+    """
+    timing = instrument.enabled
+    if timing:
+        start_time = time.time()
+    n = len(needle)
+    last = len(haystack) - n
+    matches = []
+    for start, end in merge_windows(windows):
+        start = max(0, start)
+        end = min(end, last)
+        for i in xrange(start, end):
+            hd = hamming_distance(needle, haystack[i:i + n], mismatches)
+            if hd <= mismatches:
+                matches.append(i)
+        if timing and end > start:
+            instrument.emit('window_scanned', end - start, start=start,
+                end=end)
+    if timing:
+        instrument.add_time('search.search_windows', time.time() - start_time)
+    return matches
+
+def merge_windows(windows):
+    """Merge overlapping and adjacent windows.
+
+    :param windows: an iterable of ``(start, end)`` tuples representing
+                    half-open ranges.
+    :returns: a sorted list of non-overlapping ``(start, end)`` tuples.
+                Empty windows are dropped.
+    """
+    merged = []
+    for start, end in sorted(windows):
+        if start >= end:
+            continue
+        if len(merged) > 0 and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
 def hamming_distance(s1, s2, maxdistance=None):
     """Calculate the Hamming distance between two strings.
 
@@ -46,3 +112,148 @@ def hamming_distance(s1, s2, maxdistance=None):
         if dist > maxdistance:
             return dist
     return dist
+
+class Match(object):
+
+    """Represent a probe or primer match, or a PCR product.
+
+    Only the position of the match is stored, and the matched sequence
+    is extracted from the genome file when it is first requested, so
+    the memory use grows with the number of matches rather than with
+    their length. A match can also be used as a dictionary with the
+    attribute names as keys, and ``primers`` is only a key if it is set.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the genome file.
+        - **seqname:** the name of the record.
+        - **seqindex:** the position of the record in the file.
+        - **hitstart:** the start of the match (1-based, including).
+        - **hitend:** the end of the match (1-based, including).
+        - **length:** the length of the matched sequence.
+        - **strand:** '+' or '-'.
+        - **primers:** the positions of the primers of a multiplex
+          product, or ``None``.
+        - **revcomp:** whether the sequence is reverse complemented.
+        - **source:** the genome file, e.g. a :py:class:`.GenBank` or
+          :py:class:`.Fasta` object, to extract the sequence from.
+
+    The matched sequence is ``length`` bases from ``hitstart`` of the
+    record. If the genome file cannot be indexed, e.g. FASTA read from
+    a stream, the sequence must be set with :py:meth:`extract` while
+    the record is at hand.
+    """
+
+    __slots__ = ('filename', 'seqname', 'seqindex', 'hitstart', 'hitend',
+        'length', 'strand', 'primers', 'revcomp', 'source', '_seq')
+
+    #: The keys of a match used as a dictionary, except ``primers``.
+    _keys = ('filename', 'seqname', 'seqindex', 'hitstart', 'hitend',
+        'length', 'seq', 'strand')
+
+    #: The most recently used record, as (source, seqindex, sequence),
+    #: since the matches of a record are usually extracted together.
+    _record = (None, None, None)
+
+    def __init__(self, filename, seqname, seqindex, hitstart, hitend, length,
+            strand, primers=None, revcomp=False, source=None):
+        self.filename = filename
+        self.seqname = seqname
+        self.seqindex = seqindex
+        self.hitstart = hitstart
+        self.hitend = hitend
+        self.length = length
+        self.strand = strand
+        self.primers = primers
+        self.revcomp = revcomp
+        self.source = source
+        self._seq = None
+
+    def extract(self, seq):
+        """Extract the matched sequence from the sequence of the record.
+
+        :param seq: the :py:class:`.Sequence` of the record.
+        :returns: the matched sequence, which is also kept by the match.
+        """
+        start = self.hitstart - 1
+        self._seq = seq[start:start + self.length]
+        if self.revcomp:
+            self._seq = self._seq.revcomp()
+        return self._seq
+
+    def attach(self, source):
+        """Set the genome file of a match, e.g. after unpickling it.
+
+        :param source: the genome file.
+        """
+        self.filename = source.filename
+        self.source = source
+
+    @property
+    def seq(self):
+        """The matched sequence, as a :py:class:`.Sequence` object."""
+        if self._seq is not None:
+            return self._seq
+        if self.source is None:
+            raise ValueError('the sequence of the match is not available')
+        source, seqindex, seq = Match._record
+        if source is not self.source or seqindex != self.seqindex:
+            seq = self.source[self.seqindex].seq
+            Match._record = (self.source, self.seqindex, seq)
+        start = self.hitstart - 1
+        hit_seq = seq[start:start + self.length]
+        if self.revcomp:
+            hit_seq = hit_seq.revcomp()
+        return hit_seq
+
+    def keys(self):
+        if self.primers is None:
+            return list(Match._keys)
+        return list(Match._keys) + ['primers']
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == 'seq':
+            self._seq = value
+        elif key in Match.__slots__ and not key.startswith('_'):
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in Match._keys or (key == 'primers' and
+            self.primers is not None)
+
+    def __getstate__(self):
+        # The genome file is not stored, see attach.
+        return tuple(getattr(self, x) for x in Match.__slots__ \
+            if x != 'source')
+
+    def __setstate__(self, state):
+        for key, value in zip((x for x in Match.__slots__ \
+                if x != 'source'), state):
+            setattr(self, key, value)
+        self.source = None
+
+    def __eq__(self, other):
+        # Compared by position, whether or not the sequence is extracted.
+        return isinstance(other, Match) and \
+            self.__getstate__()[:-1] == other.__getstate__()[:-1]
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Match: {0}:{1}:{2}-{3}:{4}>'.format(self.filename,
+            self.seqname, self.hitstart, self.hitend, self.strand)
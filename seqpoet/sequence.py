@@ -5,6 +5,7 @@
 .. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
 """
 
+import hashlib
 import re
 import string
 
@@ -45,6 +46,16 @@ class Sequence(object):
         """
         return Sequence(self.seq.translate(Sequence._revcomp_trans)[::-1])
 
+    def checksum(self):
+        """Get the MD5 checksum of the sequence.
+
+        Identical sequences have the same checksum, so it can be used to
+        find copies of a sequence in different files.
+
+        :returns: the checksum as a hexadecimal string.
+        """
+        return hashlib.md5(self.seq).hexdigest()
+
     def __getitem__(self, key):
         return Sequence(self.seq[key])
 
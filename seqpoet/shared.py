@@ -0,0 +1,220 @@
+#-*- encoding: utf-8 -*-
+"""Classes for sharing genome sequences between processes.
+
+The sequences of a set of genome files are packed one after the other
+into a single file, which is mapped read-only into memory by every
+process that uses it. The pages of the map are shared by all processes
+through the page cache, so adding worker processes does not add copies
+of the genomes, and the workers do not have to parse the genome files
+again. A registry of the name, offset, length and checksum of each
+record is kept in the parent process and passed to the workers, which
+only need it and the filename of the packed file.
+
+.. module:: shared
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import collections
+import mmap
+import os
+import tempfile
+
+from seqpoet import instrument
+from seqpoet.fasta import FastaRecord
+from seqpoet.genbank import ParsingError
+from seqpoet.sequence import Sequence
+
+#: The position of a record in a :py:class:`.SharedGenomes` file.
+RecordEntry = collections.namedtuple('RecordEntry',
+    ['name', 'offset', 'length', 'checksum'])
+
+class SharedGenomes(object):
+
+    """Represent the sequences of genome files packed into a shared map.
+
+    A SharedGenomes object can be pickled, e.g. to pass it to the
+    processes of a :py:class:`multiprocessing.Pool`, and only the
+    filename and the registry are pickled. The unpickled object maps
+    the same file. The object that packed the file removes it when it
+    is closed.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the packed sequences.
+        - **registry:** an ordered dictionary with a list of
+          :py:class:`RecordEntry` tuples for each genome file, keyed on
+          the filename of the genome file.
+        - **failed:** an ordered dictionary with the error message of
+          each genome file that could not be packed, keyed on the
+          filename of the genome file.
+
+    :param fname: the filename of the packed sequences.
+    :param registry: the registry of the records.
+    """
+
+    def __init__(self, fname, registry):
+        self.filename = fname
+        self.registry = registry
+        self.failed = collections.OrderedDict()
+        self._owner = False
+        self._map = None
+        with open(fname, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls, seqs, fname=None):
+        """Pack the sequences of genome files.
+
+        The records are read one at a time, so only the packed file
+        holds all sequences. Files that fail to parse are left out of
+        the registry and recorded in ``failed``.
+
+        :param seqs: a dictionary of :py:class:`.GenBank`,
+                     :py:class:`.Fasta` or similar objects, keyed on
+                     filename.
+        :param fname: the filename of the packed sequences. If
+                      ``None``, a temporary file is used.
+        :returns: a SharedGenomes object, which removes the file when
+                  it is closed.
+        """
+        if fname is None:
+            fd, fname = tempfile.mkstemp(suffix='.seq', prefix='seqpoet')
+            os.close(fd)
+        registry = collections.OrderedDict()
+        failed = collections.OrderedDict()
+        offset = 0
+        with open(fname, 'wb') as f:
+            for seqfile_name, seqfile in seqs.iteritems():
+                entries = []
+                start = offset
+                try:
+                    for i, record in enumerate(seqfile):
+                        seq = str(record.seq)
+                        checksum = None
+                        if hasattr(seqfile, 'checksum'):
+                            checksum = seqfile.checksum(i)
+                        if checksum is None:
+                            checksum = record.seq.checksum()
+                        f.write(seq)
+                        entries.append(RecordEntry(record.name, offset,
+                            len(seq), checksum))
+                        offset += len(seq)
+                except (ParsingError, ValueError) as e:
+                    f.seek(start)
+                    f.truncate()
+                    offset = start
+                    failed[seqfile_name] = str(e)
+                    continue
+                registry[seqfile_name] = entries
+        genomes = cls(fname, registry)
+        genomes.failed = failed
+        genomes._owner = True
+        return genomes
+
+    def fetch(self, fname, index, start=0, end=None):
+        """Get a region of the sequence of a record.
+
+        :param fname: the filename of the genome file.
+        :param index: the position of the record in the genome file.
+        :param start: the start of the region (0-based, including).
+        :param end: the end of the region (0-based, excluding). If
+                    ``None``, the region extends to the end of the
+                    sequence.
+        :returns: a string.
+        :raises: KeyError or IndexError if there is no such record.
+        """
+        entry = self.registry[fname][index]
+        if end is None or end > entry.length:
+            end = entry.length
+        start = max(0, start)
+        if start >= end:
+            return ''
+        seq = self._map[entry.offset + start:entry.offset + end]
+        if instrument.enabled:
+            instrument.emit('bytes_read', len(seq), filename=self.filename)
+        return seq
+
+    def genome(self, fname):
+        """Get the records of a genome file.
+
+        :param fname: the filename of the genome file.
+        :returns: a :py:class:`SharedGenome` object.
+        :raises: KeyError if the genome file was not packed.
+        """
+        if fname not in self.registry:
+            raise KeyError(fname)
+        return SharedGenome(self, fname)
+
+    def close(self):
+        """Unmap the sequences, and remove the file if it was packed
+        by this object.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._owner and os.path.exists(self.filename):
+            os.remove(self.filename)
+        self._owner = False
+
+    def __getstate__(self):
+        return (self.filename, self.registry)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '<SharedGenomes for {0} files>'.format(len(self.registry))
+
+class SharedGenome(object):
+
+    """Represent the records of one genome file in a :py:class:`SharedGenomes`.
+
+    A SharedGenome behaves like a :py:class:`.Fasta` object. The records
+    have the names of the original records, but no annotations.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the original genome file.
+
+    :param genomes: the :py:class:`SharedGenomes` object.
+    :param fname: the filename of the genome file.
+    """
+
+    def __init__(self, genomes, fname):
+        self.genomes = genomes
+        self.filename = fname
+        self._entries = genomes.registry[fname]
+
+    def checksum(self, index):
+        """Get the checksum of the sequence of a record.
+
+        :param index: the position of the record.
+        :returns: the checksum, as returned by
+                  :py:meth:`.Sequence.checksum`.
+        """
+        return self._entries[index].checksum
+
+    def __getitem__(self, index):
+        seq = self.genomes.fetch(self.filename, index)
+        record = FastaRecord(Sequence(seq), self._entries[index].name)
+        if instrument.enabled:
+            instrument.emit('record_loaded', filename=self.filename,
+                name=record.name, length=len(seq))
+        return record
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<SharedGenome for {0}>'.format(self.filename)
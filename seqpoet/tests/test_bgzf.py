@@ -0,0 +1,155 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+
+from nose.tools import raises
+
+import seqpoet
+from seqpoet import bgzf
+
+class TestBgzfReader:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        rng = random.Random(0)
+        self.data = ''.join(rng.choice('acgt\n') for _ in xrange(20000))
+        self.fname = os.path.join(self.tempdir, 'data.txt')
+        with open(self.fname, 'w') as f:
+            f.write(self.data)
+        self.bgzf_fname = bgzf.compress_file(self.fname, block_size=1000)
+        self.rng = rng
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_detect(self):
+        assert bgzf.is_gzip(self.bgzf_fname)
+        assert bgzf.is_bgzf(self.bgzf_fname)
+        assert not bgzf.is_gzip(self.fname)
+        gzip_fname = os.path.join(self.tempdir, 'data.txt.gzip')
+        with gzip.open(gzip_fname, 'w') as f:
+            f.write(self.data)
+        assert bgzf.is_gzip(gzip_fname)
+        assert not bgzf.is_bgzf(gzip_fname)
+
+    def test_gzip_compatible(self):
+        with gzip.open(self.bgzf_fname) as f:
+            assert f.read() == self.data
+
+    def test_read(self):
+        with bgzf.BgzfReader(self.bgzf_fname) as f:
+            assert f.read() == self.data
+            assert f.read() == ''
+
+    def test_lines(self):
+        with bgzf.BgzfReader(self.bgzf_fname) as f:
+            assert list(f) == self.data.splitlines(True)
+
+    def test_seek(self):
+        with bgzf.BgzfReader(self.bgzf_fname) as f:
+            for _ in xrange(100):
+                offset = self.rng.randint(0, len(self.data))
+                f.seek(offset)
+                assert f.tell() == offset
+                assert f.read(1500) == self.data[offset:offset + 1500]
+                f.seek(offset)
+                end = self.data.find('\n', offset) + 1 or len(self.data)
+                assert f.readline() == self.data[offset:end]
+
+    def test_gzi(self):
+        index = bgzf.build_index(self.bgzf_fname)
+        assert len(index) == 22
+        assert index[-1][1] == len(self.data)
+        assert bgzf.load_index(self.bgzf_fname) == index
+        assert os.path.isfile(self.bgzf_fname + '.gzi')
+        assert bgzf.read_gzi(self.bgzf_fname + '.gzi') == index[:-1]
+        assert bgzf.load_index(self.bgzf_fname) == index
+
+    def test_data_size(self):
+        assert bgzf.data_size(self.fname) == len(self.data)
+        assert bgzf.data_size(self.bgzf_fname) == len(self.data)
+
+    @raises(ValueError)
+    def test_not_bgzf(self):
+        bgzf.build_index(self.fname)
+
+class TestCompressedSequences:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.tempdir = tempfile.mkdtemp()
+        self.gb_fname = os.path.join(testdir, 'data', 'U49845.gb')
+        self.fasta_fname = os.path.join(self.tempdir, 'valid.fasta')
+        shutil.copy(os.path.join(testdir, 'data', 'valid_noindex.fasta'),
+            self.fasta_fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def gzip_file(self, fname):
+        gzip_fname = os.path.join(self.tempdir,
+            os.path.basename(fname) + '.gz')
+        with open(fname) as fin:
+            with gzip.open(gzip_fname, 'w') as fout:
+                fout.write(fin.read())
+        return gzip_fname
+
+    def check_genbank(self, fname):
+        gb = seqpoet.GenBank(fname)
+        plain = seqpoet.GenBank(self.gb_fname)
+        assert len(gb) == 1
+        assert gb[0].seq == plain[0].seq
+        assert len(gb[0].features['CDS']) == 3
+        assert gb[0].features['CDS'][2].qualifiers == \
+            plain[0].features['CDS'][2].qualifiers
+
+    def test_genbank_gzip(self):
+        self.check_genbank(self.gzip_file(self.gb_fname))
+
+    def test_genbank_gzip_not_in_memory(self):
+        gb = seqpoet.GenBank(self.gzip_file(self.gb_fname))
+        assert gb._tempname is None
+        assert not any(isinstance(x, str) and len(x) > 1000
+            for x in vars(gb).itervalues())
+        assert len(gb[0].seq) == 5028
+        assert gb._tempname is None
+
+    def test_genbank_gzip_decompressed_while_iterating(self):
+        gb = seqpoet.GenBank(self.gzip_file(self.gb_fname))
+        loci = iter(gb)
+        locus = loci.next()
+        tempname = gb._tempname
+        assert os.path.getsize(tempname) == os.path.getsize(self.gb_fname)
+        assert gb[0].seq == locus.seq
+        assert list(loci) == []
+        assert gb._tempname is None
+        assert not os.path.exists(tempname)
+
+    def test_genbank_bgzf(self):
+        self.check_genbank(bgzf.compress_file(self.gb_fname,
+            os.path.join(self.tempdir, 'U49845.gb.gz'), block_size=500))
+
+    @raises(seqpoet.genbank.ParsingError)
+    def test_fasta_as_genbank(self):
+        seqpoet.GenBank(self.gzip_file(self.fasta_fname))
+
+    def test_fasta_bgzf(self):
+        fname = bgzf.compress_file(self.fasta_fname, block_size=50)
+        fasta = seqpoet.Fasta(fname)
+        assert os.path.isfile(fname + '.gzi')
+        assert str(fasta.index) == str(seqpoet.Fasta(self.fasta_fname).index)
+        assert fasta[2].name == 'aaa'
+        assert len(fasta[3]) == 73
+        assert fasta.get_record_by_name('seq2').seq == \
+            'cacaggaggatagaccagatgacagata'
+
+    def test_fasta_reader_gzip(self):
+        fname = self.gzip_file(self.fasta_fname)
+        records = list(seqpoet.FastaReader(fname))
+        assert [len(x) for x in records] == [78, 28, 44, 73]
+
+    @raises(ValueError)
+    def test_fasta_gzip_random_access(self):
+        seqpoet.Fasta(self.gzip_file(self.fasta_fname))
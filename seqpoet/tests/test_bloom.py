@@ -0,0 +1,78 @@
+import os
+import random
+import shutil
+import tempfile
+
+import seqpoet
+from seqpoet.bloom import BloomFilter, KmerFilter, genome_filter
+
+class TestBloomFilter:
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 4)
+        items = ['item{0}'.format(i) for i in xrange(100)]
+        for item in items:
+            bloom.add(item)
+        assert all(x in bloom for x in items)
+
+    def test_empty(self):
+        bloom = BloomFilter(1000, 4)
+        assert 'acgt' not in bloom
+
+class TestKmerFilter:
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.seq = ''.join(rng.choice('acgt') for _ in xrange(5000))
+        self.kmer_filter = KmerFilter.from_records(
+            [seqpoet.FastaRecord(self.seq, 'test')], k=8)
+
+    def test_exact_match(self):
+        assert self.kmer_filter.may_contain(self.seq[100:140])
+        assert self.kmer_filter.may_occur(self.seq[100:140])
+
+    def test_mismatches(self):
+        needle = list(self.seq[100:140])
+        needle[5] = 'a' if needle[5] != 'a' else 'c'
+        needle[30] = 'a' if needle[30] != 'a' else 'c'
+        needle = ''.join(needle)
+        assert self.kmer_filter.may_contain(needle, mismatches=2)
+
+    def test_reverse_strand(self):
+        needle = seqpoet.Sequence(self.seq[100:140]).revcomp()
+        assert self.kmer_filter.may_occur(needle, mismatches=0)
+
+    def test_absent(self):
+        assert not self.kmer_filter.may_occur('n' * 40, mismatches=2)
+
+    def test_short_needle(self):
+        # Parts shorter than k cannot be ruled out
+        assert self.kmer_filter.may_occur('n' * 20, mismatches=2)
+
+class TestGenomeFilter:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.tempdir = tempfile.mkdtemp()
+        self.gb_fname = os.path.join(self.tempdir, 'U49845.gb')
+        shutil.copy(os.path.join(testdir, 'data', 'U49845.gb'),
+            self.gb_fname)
+        self.gb = seqpoet.GenBank(self.gb_fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_sidecar(self):
+        kmer_filter = genome_filter(self.gb, k=10)
+        assert os.path.isfile(self.gb_fname + '.bloom')
+        probe = str(self.gb[0].seq[700:730])
+        assert kmer_filter.may_occur(probe)
+        assert not kmer_filter.may_occur('n' * 30)
+
+        loaded = genome_filter(self.gb, k=10)
+        assert loaded.bloom.bits == kmer_filter.bloom.bits
+
+    def test_rebuild_other_k(self):
+        genome_filter(self.gb, k=10)
+        kmer_filter = genome_filter(self.gb, k=12)
+        assert kmer_filter.k == 12
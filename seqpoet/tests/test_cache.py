@@ -0,0 +1,301 @@
+from nose.tools import raises
+import os
+import shutil
+import tempfile
+
+import seqpoet
+from seqpoet.cache import GenomeCache, CachedGenome, ResultCache, Checkpoint
+from seqpoet.cache import indexed_fasta
+
+class TestGenomeCache:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.gb_fname = os.path.join(self.tempdir, 'U49845.gb')
+        self.fasta_fname = os.path.join(self.tempdir, 'valid.fasta')
+        shutil.copy(os.path.join(testdir, 'data', 'U49845.gb'),
+            self.gb_fname)
+        shutil.copy(os.path.join(testdir, 'data', 'valid_noindex.fasta'),
+            self.fasta_fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_create_directory(self):
+        cache = GenomeCache(self.cache_dir)
+        assert os.path.isdir(self.cache_dir)
+
+    def test_missing(self):
+        cache = GenomeCache(self.cache_dir)
+        assert cache.load(self.gb_fname) is None
+
+    def test_genbank(self):
+        cache = GenomeCache(self.cache_dir)
+        stored = cache.store(seqpoet.GenBank(self.gb_fname))
+        assert isinstance(stored, CachedGenome)
+
+        genome = GenomeCache(self.cache_dir).load(self.gb_fname)
+        assert genome is not None
+        assert genome.format == 'genbank'
+        assert genome.filename == self.gb_fname
+        assert len(genome) == 1
+        locus = genome[0]
+        assert locus.name == 'SCU49845'
+        assert len(locus.seq) == 5028
+        assert len(locus.features['CDS']) == 3
+        assert genome.checksum(0) == locus.seq.checksum()
+        assert locus.header == seqpoet.GenBank(self.gb_fname)[0].header
+        assert [x.name for x in genome] == ['SCU49845']
+
+    def test_fasta(self):
+        cache = GenomeCache(self.cache_dir)
+        cache.store(seqpoet.Fasta(self.fasta_fname))
+        genome = cache.load(self.fasta_fname)
+        assert genome.format == 'fasta'
+        assert len(genome) == 4
+        assert [x.name for x in genome] == ['seq1', 'seq2', 'aaa', 'bbb']
+        assert [len(x) for x in genome] == [78, 28, 44, 73]
+
+    def test_modified_file(self):
+        cache = GenomeCache(self.cache_dir)
+        cache.store(seqpoet.GenBank(self.gb_fname))
+        st = os.stat(self.gb_fname)
+        os.utime(self.gb_fname, (st.st_atime, st.st_mtime + 10))
+        assert cache.load(self.gb_fname) is None
+
+    def test_two_genomes(self):
+        cache = GenomeCache(self.cache_dir)
+        cache.store(seqpoet.GenBank(self.gb_fname))
+        cache.store(seqpoet.Fasta(self.fasta_fname))
+        gb = cache.load(self.gb_fname)
+        fasta = cache.load(self.fasta_fname)
+        assert gb[0].name == 'SCU49845'
+        assert fasta[0].name == 'seq1'
+        assert gb[0].name == 'SCU49845'
+
+    def test_records_not_held(self):
+        cache = GenomeCache(self.cache_dir)
+        stored = cache.store(seqpoet.FastaReader(self.fasta_fname))
+        assert not any(isinstance(x, list) and
+            any(isinstance(y, seqpoet.FastaRecord) for y in x)
+            for x in vars(stored).itervalues())
+        assert str(stored[2].seq) == \
+            str(seqpoet.Fasta(self.fasta_fname)[2].seq)
+
+    def test_truncated(self):
+        cache = GenomeCache(self.cache_dir)
+        stored = cache.store(seqpoet.GenBank(self.gb_fname))
+        with open(stored.path, 'r+b') as f:
+            f.truncate(os.path.getsize(stored.path) - 4)
+        assert cache.load(self.gb_fname) is None
+
+    @raises(TypeError)
+    def test_unsupported_type(self):
+        cache = GenomeCache(self.cache_dir)
+        cache.store([seqpoet.FastaRecord('acgt', 'test')])
+
+class TestIndexedFasta:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.tempdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tempdir, 'valid.fasta')
+        shutil.copy(os.path.join(testdir, 'data', 'valid_noindex.fasta'),
+            self.fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_stored_index(self):
+        fasta = indexed_fasta(self.fname)
+        assert os.path.isfile(self.fname + '.fidx')
+        assert not os.path.exists(self.fname + '.fai')
+        stored = indexed_fasta(self.fname)
+        assert stored.index.names == ['seq1', 'seq2', 'aaa', 'bbb']
+        assert stored.checksum(1) == fasta[1].seq.checksum()
+        assert str(stored[3].seq) == str(fasta[3].seq)
+
+    def test_modified_file(self):
+        indexed_fasta(self.fname)
+        with open(self.fname, 'a') as f:
+            f.write('>ccc\nacgt\n')
+        fasta = indexed_fasta(self.fname)
+        assert len(fasta) == 5
+        assert fasta.checksum(4) == seqpoet.Sequence('acgt').checksum()
+
+    def test_samtools_index(self):
+        index = seqpoet.Fasta(self.fname).index
+        with open(self.fname + '.fai', 'w') as f:
+            f.write(str(index) + '\n')
+        fasta = indexed_fasta(self.fname)
+        assert len(fasta) == 4
+        assert fasta.checksum(0) is None
+        assert not os.path.exists(self.fname + '.fidx')
+
+    @raises(ValueError)
+    def test_uneven(self):
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'data',
+            'uneven.fasta'), self.fname)
+        indexed_fasta(self.fname)
+
+class TestResultCache:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'results')
+        self.fname = os.path.join(self.tempdir, 'U49845.gb')
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'data',
+            'U49845.gb'), self.fname)
+        self.query = ('probe', ('acgtacgt',), 2, None, False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_missing(self):
+        cache = ResultCache(self.cache_dir)
+        assert os.path.isdir(self.cache_dir)
+        assert cache.load(self.query, self.fname) is None
+
+    def test_store(self):
+        results = [{'seqname': 'SCU49845', 'hitstart': 700}]
+        assert ResultCache(self.cache_dir).store(self.query, self.fname,
+            results)
+        cache = ResultCache(self.cache_dir)
+        assert cache.load(self.query, self.fname) == results
+        assert cache.load(('probe', ('acgt',), 2, None, False),
+            self.fname) is None
+
+    def test_moved_file(self):
+        ResultCache(self.cache_dir).store(self.query, self.fname, [])
+        moved = os.path.join(self.tempdir, 'moved.gb')
+        os.rename(self.fname, moved)
+        assert ResultCache(self.cache_dir).load(self.query, moved) == []
+
+    def test_modified_file(self):
+        ResultCache(self.cache_dir).store(self.query, self.fname, [])
+        with open(self.fname, 'a') as f:
+            f.write('\n')
+        assert ResultCache(self.cache_dir).load(self.query,
+            self.fname) is None
+
+    def test_checksum_computed_once(self):
+        hashed = []
+        file_checksum = seqpoet.cache.file_checksum
+        def counting_checksum(fname):
+            hashed.append(fname)
+            return file_checksum(fname)
+        seqpoet.cache.file_checksum = counting_checksum
+        try:
+            assert ResultCache(self.cache_dir).load(self.query,
+                self.fname) is None
+            assert hashed == []
+            ResultCache(self.cache_dir).store(self.query, self.fname, [])
+            assert hashed == [self.fname]
+            assert ResultCache(self.cache_dir).load(self.query,
+                self.fname) == []
+            assert ResultCache(self.cache_dir).load(
+                ('probe', ('acgt',), 2, None, False), self.fname) is None
+            assert hashed == [self.fname]
+        finally:
+            seqpoet.cache.file_checksum = file_checksum
+
+    def test_evict(self):
+        cache = ResultCache(self.cache_dir)
+        queries = [('probe', (x,), 2, None, False) for x in ('a', 'c', 'g')]
+        for i, query in enumerate(queries):
+            cache.store(query, self.fname, range(1000))
+            path = cache._path(query, self.fname)
+            os.utime(path, (i, i))
+        cache.load(queries[0], self.fname)
+        cache.max_size = 2 * os.path.getsize(path)
+        assert cache.evict() == 1
+        assert cache.load(queries[0], self.fname) is not None
+        assert cache.load(queries[1], self.fname) is None
+        assert cache.load(queries[2], self.fname) is not None
+
+class TestCheckpoint:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.journal = os.path.join(self.tempdir, 'checkpoint')
+        self.fnames = []
+        for name in ['a.gb', 'b.gb']:
+            fname = os.path.join(self.tempdir, name)
+            shutil.copy(os.path.join(os.path.dirname(__file__), 'data',
+                'U49845.gb'), fname)
+            self.fnames.append(fname)
+        self.query = ('probe', ('acgtacgt',), 2, None, False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_resume(self):
+        checkpoint = Checkpoint(self.journal, self.query)
+        checkpoint.store(self.query, self.fnames[0], [{'hitstart': 1}])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert checkpoint.load(self.query, self.fnames[0]) == \
+            [{'hitstart': 1}]
+        assert checkpoint.load(self.query, self.fnames[1]) is None
+        checkpoint.store(self.query, self.fnames[1], [])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert sorted(checkpoint.done) == self.fnames
+
+    def test_no_resume(self):
+        checkpoint = Checkpoint(self.journal, self.query)
+        checkpoint.store(self.query, self.fnames[0], [])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.journal, self.query)
+        assert checkpoint.load(self.query, self.fnames[0]) is None
+
+    def test_truncated(self):
+        checkpoint = Checkpoint(self.journal, self.query)
+        checkpoint.store(self.query, self.fnames[0], [])
+        checkpoint.store(self.query, self.fnames[1], range(100))
+        checkpoint.close()
+        with open(self.journal, 'r+b') as f:
+            f.truncate(os.path.getsize(self.journal) - 10)
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert checkpoint.done.keys() == [self.fnames[0]]
+        checkpoint.store(self.query, self.fnames[1], [])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert sorted(checkpoint.done) == self.fnames
+
+    def test_truncated_class_reference(self):
+        match = seqpoet.search.Match(self.fnames[1], 'SCU49845', 0, 1, 8,
+            8, '+')
+        match.extract(seqpoet.Sequence('acgtacgt'))
+        checkpoint = Checkpoint(self.journal, self.query)
+        checkpoint.store(self.query, self.fnames[0], [])
+        checkpoint.store(self.query, self.fnames[1], [match])
+        checkpoint.close()
+        with open(self.journal, 'rb') as f:
+            data = f.read()
+        cut = data.index('seqpoet.search\nMatc') + len('seqpoet.search\nMatc')
+        with open(self.journal, 'r+b') as f:
+            f.truncate(cut)
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert checkpoint.done.keys() == [self.fnames[0]]
+        checkpoint.store(self.query, self.fnames[1], [match])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert checkpoint.load(self.query, self.fnames[1]) == [match]
+
+    def test_modified_file(self):
+        checkpoint = Checkpoint(self.journal, self.query)
+        checkpoint.store(self.query, self.fnames[0], [])
+        checkpoint.close()
+        st = os.stat(self.fnames[0])
+        os.utime(self.fnames[0], (st.st_atime, st.st_mtime + 10))
+        checkpoint = Checkpoint(self.journal, self.query, resume=True)
+        assert checkpoint.load(self.query, self.fnames[0]) is None
+
+    @raises(ValueError)
+    def test_other_query(self):
+        Checkpoint(self.journal, self.query).close()
+        Checkpoint(self.journal, ('probe', ('acgt',), 2, None, False),
+            resume=True)
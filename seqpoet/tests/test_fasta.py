@@ -1,6 +1,8 @@
 from nose.tools import raises
 from nose.plugins.skip import SkipTest
 import os
+import shutil
+import tempfile
 
 import seqpoet
 
@@ -34,6 +36,19 @@ class TestFastaIndex:
         faidx = seqpoet.FastaIndex(self.valid_index)
         assert faidx.keys() == ['seq1', 'seq2', 'aaa', 'bbb']
 
+    def test_lookup_by_name(self):
+        faidx = seqpoet.FastaIndex(self.valid_index)
+        assert faidx['aaa'] == faidx[2]
+        assert faidx['aaa']['offset'] == 127
+        assert faidx.get_position('bbb') == 3
+        assert 'seq2' in faidx
+        assert 'ccc' not in faidx
+
+    @raises(KeyError)
+    def test_lookup_missing_name(self):
+        faidx = seqpoet.FastaIndex(self.valid_index)
+        faidx['ccc']
+
     def test_iter(self):
         faidx = seqpoet.FastaIndex(self.valid_index)
         for k, v in faidx:
@@ -109,6 +124,17 @@ class TestFasta:
         fasta = seqpoet.Fasta(self.valid_index)
         fasta[4]
 
+    def test_record_by_name(self):
+        fasta = seqpoet.Fasta(self.valid_index)
+        record = fasta.get_record_by_name('seq2')
+        assert record.name == 'seq2'
+        assert record.seq == 'cacaggaggatagaccagatgacagata'
+
+    @raises(KeyError)
+    def test_record_by_missing_name(self):
+        fasta = seqpoet.Fasta(self.valid_index)
+        fasta.get_record_by_name('ccc')
+
     @raises(ValueError)
     def test_parse_duplicate_fasta(self):
         fasta = seqpoet.Fasta(self.dups_fname)
@@ -154,10 +180,124 @@ class TestFastaWithoutIndex:
                 .format(repr(headers[i]), seqs[i], lens[i]), \
                 'wrong repr string: {0}'.format(repr(record))
 
+    def test_checksums(self):
+        fasta = seqpoet.Fasta(self.valid_noindex)
+        for i, record in enumerate(fasta):
+            assert fasta.checksum(i) == record.seq.checksum()
+
     @raises(ValueError)
     def test_duplicate_headers(self):
         fasta = seqpoet.Fasta(self.dups_noindex)
 
+class TestShortRecords:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tempdir, 'short.fasta')
+        with open(self.fname, 'w') as f:
+            f.write('>long\nacgtacgtac\nacgtacgtac\nacg\n>short\nacgta\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_record_shorter_than_line(self):
+        fasta = seqpoet.Fasta(self.fname)
+        assert fasta.get_record_by_name('short').seq == 'acgta'
+        assert fasta[0].seq == 'acgtacgtacacgtacgtacacg'
+
+class TestFastaReader:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.valid = os.path.join(testdir, 'data', 'valid_noindex.fasta')
+        self.empty_sequence = os.path.join(testdir, 'data',
+            'empty_sequence.fasta')
+        self.dups = os.path.join(testdir, 'data', 'dups_noindex.fasta')
+        self.gb = os.path.join(testdir, 'data', 'U49845.gb')
+
+    def tearDown(self):
+        if os.path.isfile(self.valid + '.fai'):
+            os.unlink(self.valid + '.fai')
+
+    def test_same_as_fasta(self):
+        reader = seqpoet.FastaReader(self.valid, bufsize=16)
+        records = list(reader)
+        assert [x.name for x in records] == ['seq1', 'seq2', 'aaa', 'bbb']
+        fasta = seqpoet.Fasta(self.valid)
+        for i, record in enumerate(records):
+            assert record.seq == fasta.get_record(i).seq
+        assert len(fasta) == 4
+
+    def test_length(self):
+        reader = seqpoet.FastaReader(self.empty_sequence)
+        assert len(reader) == 5
+        assert [len(x) for x in reader] == [78, 28, 0, 44, 73]
+
+    def test_stream(self):
+        with open(self.valid) as f:
+            reader = seqpoet.FastaReader(f)
+            assert reader.filename == self.valid
+            assert len(list(reader)) == 4
+            assert len(list(reader)) == 0
+
+    @raises(TypeError)
+    def test_stream_length(self):
+        with open(self.valid) as f:
+            len(seqpoet.FastaReader(f))
+
+    @raises(ValueError)
+    def test_duplicate_headers(self):
+        list(seqpoet.FastaReader(self.dups))
+
+    @raises(ValueError)
+    def test_genbank(self):
+        seqpoet.FastaReader(self.gb)
+
+class TestFastaWriter:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tempdir, 'out.fasta')
+        self.records = [
+            seqpoet.FastaRecord('acgt' * 40, 'long'),
+            seqpoet.FastaRecord('acg', 'short'),
+            seqpoet.FastaRecord('', 'empty'),
+            seqpoet.FastaRecord('ac' * 35, 'one line')
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_same_as_str(self):
+        with seqpoet.FastaWriter(self.fname) as writer:
+            for record in self.records:
+                writer.write(record)
+        with open(self.fname) as f:
+            assert f.read() == ''.join(str(x) + '\n' \
+                for x in self.records).replace('>empty\n\n', '>empty\n')
+
+    def test_index(self):
+        with seqpoet.FastaWriter(self.fname, width=60, index=True,
+                bufsize=10) as writer:
+            for record in self.records:
+                writer.write(record)
+        written = str(seqpoet.FastaIndex(self.fname + '.fai'))
+        os.unlink(self.fname + '.fai')
+        assert written == str(seqpoet.FastaIndex(self.fname + '.fai'))
+        fasta = seqpoet.Fasta(self.fname)
+        for i, record in enumerate(self.records):
+            assert fasta[i].name == record.name
+            assert fasta[i].seq == record.seq
+
+    @raises(ValueError)
+    def test_index_file_object(self):
+        with open(self.fname, 'w') as f:
+            seqpoet.FastaWriter(f, index=True)
+
+    def test_wrap(self):
+        assert seqpoet.fasta.wrap('acgtacg', 3) == ['acg', 'tac', 'g']
+        assert seqpoet.fasta.wrap('', 3) == []
+
 class TestInvalidFasta:
 
     def setUp(self):
@@ -0,0 +1,106 @@
+import os
+import random
+import shutil
+import tempfile
+
+import seqpoet
+from seqpoet.fmindex import FMIndex, genome_index, suffix_array
+from seqpoet.search import search
+
+class TestSuffixArray:
+
+    def test_banana(self):
+        assert list(suffix_array('banana$')) == [6, 5, 3, 1, 0, 4, 2]
+
+    def test_repeat(self):
+        text = 'aaaa$'
+        assert list(suffix_array(text)) == [4, 3, 2, 1, 0]
+
+    def test_empty(self):
+        assert list(suffix_array('')) == []
+
+    def test_same_as_sort(self):
+        rng = random.Random(0)
+        text = ''.join(rng.choice('acgtn') for _ in xrange(3000)) + \
+            'a' * 50 + 'acgtacgt' * 20
+        for k in (1, 3, 8):
+            assert list(suffix_array(text, k)) == \
+                sorted(xrange(len(text)), key=lambda i: text[i:])
+
+class TestFMIndex:
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.seq = ''.join(rng.choice('acgt') for _ in xrange(2000))
+        self.index = FMIndex(self.seq, occ_step=16, sa_step=8)
+        self.rng = rng
+
+    def test_length(self):
+        assert len(self.index) == 2000
+
+    def test_exact(self):
+        needle = self.seq[100:120]
+        assert self.index.search(needle) == search(needle, self.seq)
+        assert 100 in self.index.search(needle)
+
+    def test_same_as_search(self):
+        for mismatches in xrange(3):
+            for _ in xrange(10):
+                start = self.rng.randint(0, len(self.seq) - 10)
+                needle = self.seq[start:start + 10]
+                assert self.index.search(needle, mismatches) == \
+                    search(needle, self.seq, mismatches)
+
+    def test_last_position(self):
+        # search does not report a match at the very end.
+        needle = self.seq[-10:]
+        assert len(self.seq) - 10 in self.index.find(needle)
+        assert len(self.seq) - 10 not in self.index.search(needle)
+
+    def test_n(self):
+        seq = 'acgtnnacgtacgn'
+        index = FMIndex(seq)
+        for needle in ['acg', 'nna', 'cgn', 'ttt']:
+            for mismatches in xrange(3):
+                assert index.search(needle, mismatches) == \
+                    search(needle, seq, mismatches)
+
+    def test_sequence_object(self):
+        seq = seqpoet.Sequence(self.seq)
+        index = FMIndex(seq)
+        needle = seq[300:320]
+        assert index.search(needle) == search(str(needle), self.seq)
+
+class TestGenomeIndex:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.tempdir = tempfile.mkdtemp()
+        self.gb_fname = os.path.join(self.tempdir, 'U49845.gb')
+        shutil.copy(os.path.join(testdir, 'data', 'U49845.gb'),
+            self.gb_fname)
+        self.gb = seqpoet.GenBank(self.gb_fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_sidecar(self):
+        indexes = genome_index(self.gb)
+        assert os.path.isfile(self.gb_fname + '.fmi')
+        assert len(indexes) == 1
+        seq = str(self.gb[0].seq)
+        needle = seq[700:730]
+        assert indexes[0].search(needle) == search(needle, seq)
+
+        loaded = genome_index(self.gb)
+        assert loaded[0].bwt == indexes[0].bwt
+
+    def test_rebuild_modified(self):
+        genome_index(self.gb)
+        st = os.stat(self.gb_fname)
+        os.utime(self.gb_fname, (st.st_atime, st.st_mtime + 10))
+        assert seqpoet.cache.load_sidecar(self.gb_fname, '.fmi',
+            (64, 32)) is None
+        genome_index(self.gb)
+        assert seqpoet.cache.load_sidecar(self.gb_fname, '.fmi',
+            (64, 32)) is not None
@@ -25,6 +25,9 @@ class TestGenBank:
     def test_mRNA(self):
         assert len(self.gb[0].features['mRNA']) == 3
 
+    def test_checksum(self):
+        assert self.gb.checksum(0) == self.gb[0].seq.checksum()
+
     def test_neighbors(self):
         locus = self.gb[0]
         gbf = locus.features['mRNA'][0]
@@ -81,6 +84,27 @@ class TestGenBank:
         assert all(x in header['REFERENCE'][0][1] for x in ['AUTHORS',
             'TITLE', 'JOURNAL', 'PUBMED'])
 
+    def test_feature_table(self):
+        table = self.gb.feature_table()
+        assert table.keys() == ['locus', 'type', 'start', 'end', 'strand']
+        assert len(table['type']) == 11
+        assert all(x == 0 for x in table['locus'])
+        assert list(table['start']) == sorted(table['start'])
+        assert table['type'].count('gene') == 4
+
+    def test_feature_table_types(self):
+        table = self.gb.feature_table(types=['CDS', 'nonexisting'])
+        assert table['type'] == ['CDS', 'CDS', 'CDS']
+        assert list(table['start']) == [0, 686, 3299]
+        assert list(table['end']) == [205, 3157, 4036]
+        assert list(table['strand']) == ['+', '+', '-']
+
+    def test_feature_table_qualifiers(self):
+        table = self.gb.feature_table(types=['CDS'],
+            qualifiers=['gene', 'product'])
+        assert table['gene'] == [None, 'AXL2', 'REV7']
+        assert table['product'] == ['TCP1-beta', 'Axl2p', 'Rev7p']
+
     def test_parse_header(self):
         '''Parse malformed locus line'''
         gbstring = '\n'.join(['LOCUS       NODE_18 673 bp   DNA linear',
@@ -119,6 +143,52 @@ class TestGenBank:
         finally:
             os.unlink(gbfile)
 
+class TestOperons:
+
+    def setUp(self):
+        features = {
+            'CDS': [seqpoet.GenBankFeature('test', 'CDS', Location(x)) \
+                for x in ['7..693', '697..3303', '3900..4500',
+                    'complement(4510..4800)', 'complement(4850..5500)']],
+            'source': [seqpoet.GenBankFeature('test', 'source',
+                Location('1..5758'))]
+        }
+        self.locus = seqpoet.GenBankLocus('test',
+            seqpoet.Sequence('a' * 5758), features)
+
+    def test_operons(self):
+        operons = self.locus.operons('CDS', max_distance=500)
+        assert len(operons) == 3, 'found {0} operons'.format(len(operons))
+        assert [str(x.location) for x in operons[0]] == ['7..693',
+            '697..3303']
+        assert [str(x.location) for x in operons[1]] == ['3900..4500']
+        assert len(operons[2]) == 2
+        assert all(x.location.is_complement for x in operons[2])
+
+    def test_operons_distance(self):
+        operons = self.locus.operons('CDS', max_distance=600)
+        assert len(operons) == 2, 'found {0} operons'.format(len(operons))
+        assert len(operons[0]) == 3
+
+    def test_operon_at_location(self):
+        genes, upstream_edge, downstream_edge = \
+            self.locus.operon_at_location(Location('700..750'))
+        assert [str(x.location) for x in genes] == ['7..693', '697..3303']
+        assert upstream_edge
+        assert not downstream_edge
+
+    def test_operon_at_location_complement(self):
+        genes, upstream_edge, downstream_edge = \
+            self.locus.operon_at_location(Location('complement(5000..5010)'))
+        assert len(genes) == 2
+        assert upstream_edge
+        assert not downstream_edge
+
+    def test_operon_at_location_wrong_strand(self):
+        genes, upstream_edge, downstream_edge = \
+            self.locus.operon_at_location(Location('complement(700..750)'))
+        assert genes == []
+
 class TestGenBankLocal:
 
     def setUp(self):
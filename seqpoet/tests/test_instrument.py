@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import raises
+
+import seqpoet
+from seqpoet import instrument
+
+class TestInstrument:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.events = []
+        instrument.reset()
+        instrument.enable()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+        for event in ['record_loaded', 'bytes_read', 'window_scanned',
+                'cache_hit', 'cache_miss']:
+            while self.callback in instrument._callbacks.get(event, []):
+                instrument.unsubscribe(event, self.callback)
+        shutil.rmtree(self.tempdir)
+
+    def callback(self, event, value, **info):
+        self.events.append((event, value, info))
+
+    def test_disabled(self):
+        instrument.disable()
+        seqpoet.search.search('acg', 'acgtacgt')
+        assert len(instrument.counters) == 0
+        assert len(instrument.timers) == 0
+
+    def test_search(self):
+        instrument.subscribe('window_scanned', self.callback)
+        seqpoet.search.search('acg', 'acgtacgt')
+        assert instrument.counters['window_scanned'] == 5
+        assert instrument.calls['search.search'] == 1
+        assert self.events == [('window_scanned', 5, {'start': 0, 'end': 5})]
+
+    def test_search_windows(self):
+        seqpoet.search.search_windows('acg', 'acgtacgtacgt', [(0, 2), (6, 20)])
+        assert instrument.counters['window_scanned'] == 5
+        assert instrument.calls['search.search_windows'] == 1
+
+    def test_fasta(self):
+        fname = os.path.join(self.tempdir, 'test.fasta')
+        with open(fname, 'w') as f:
+            f.write('>seq1\nacgtac\ngt\n>seq2\nac\n')
+        instrument.subscribe('record_loaded', self.callback)
+        fasta = seqpoet.Fasta(fname)
+        assert instrument.counters['cache_miss:fai'] == 1
+        assert instrument.calls['FastaIndex.create_index'] == 1
+        record = fasta.get_record(0)
+        assert str(record.seq) == 'acgtacgt'
+        assert instrument.counters['bytes_read'] == 9
+        assert self.events[0] == ('record_loaded', 1,
+            {'filename': fname, 'name': 'seq1', 'length': 8})
+        records = [x for x in seqpoet.FastaReader(fname)]
+        assert instrument.counters['record_loaded'] == 3
+        assert instrument.counters['bytes_read'] == 9 + 25
+
+    def test_genbank(self):
+        fname = os.path.join(os.path.dirname(__file__), 'data', 'U49845.gb')
+        gb = seqpoet.GenBank(fname)
+        assert instrument.calls['GenBank._index'] == 1
+        locus = gb[0]
+        assert instrument.calls['GenBank.__getitem__'] == 1
+        assert instrument.counters['record_loaded'] == 1
+        assert 0 < instrument.counters['bytes_read'] <= os.path.getsize(fname)
+
+    def test_genome_cache(self):
+        fname = os.path.join(os.path.dirname(__file__), 'data', 'U49845.gb')
+        cache = seqpoet.cache.GenomeCache(self.tempdir)
+        instrument.subscribe('cache_miss', self.callback)
+        assert cache.load(fname) is None
+        cache.store(seqpoet.GenBank(fname))
+        assert cache.load(fname) is not None
+        assert instrument.counters['cache_miss:genome'] == 1
+        assert instrument.counters['cache_hit:genome'] == 1
+        assert self.events == [('cache_miss', 1,
+            {'cache': 'genome', 'key': fname})]
+
+    def test_sidecar(self):
+        fname = os.path.join(self.tempdir, 'test.fasta')
+        with open(fname, 'w') as f:
+            f.write('>seq1\nacgt\n')
+        assert seqpoet.cache.load_sidecar(fname, '.test') is None
+        seqpoet.cache.save_sidecar(fname, '.test', [1, 2])
+        assert seqpoet.cache.load_sidecar(fname, '.test') == [1, 2]
+        assert instrument.counters['cache_miss:test'] == 1
+        assert instrument.counters['cache_hit:test'] == 1
+        assert instrument.counters['cache_miss'] == 1
+
+    def test_timer(self):
+        with instrument.timer('block'):
+            pass
+        instrument.disable()
+        with instrument.timer('block'):
+            pass
+        assert instrument.calls['block'] == 1
+        snapshot = instrument.snapshot()
+        assert snapshot['calls'] == {'block': 1}
+
+    def test_merge(self):
+        instrument.emit('bytes_read', 10)
+        instrument.merge({'counters': {'bytes_read': 5, 'cache_hit': 1},
+            'timers': {'block': 0.5}, 'calls': {'block': 1}})
+        assert instrument.counters['bytes_read'] == 15
+        assert instrument.counters['cache_hit'] == 1
+        assert instrument.timers['block'] == 0.5
+        assert instrument.calls['block'] == 1
+
+    @raises(ValueError)
+    def test_unsubscribe_missing(self):
+        instrument.unsubscribe('bytes_read', self.callback)
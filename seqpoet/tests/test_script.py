@@ -1,7 +1,19 @@
+import collections
+import functools
+import gzip
 import imp
+import itertools
+import json
 import os
+import random
+import shutil
+import StringIO
+import tempfile
+import threading
+import urllib2
 
 from nose.plugins.skip import SkipTest
+from nose.tools import raises
 
 import seqpoet
 
@@ -89,3 +101,799 @@ class TestFindOperon:
 
 		operon_len = len(res[0]['seq'])
 		assert operon_len == 2378, 'length is {0}'.format(operon_len)
+
+class TestFindOperonU49845:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		self.matches = [{
+			'filename': self.gb_fname,
+			'hitstart': 700,
+			'hitend': 749,
+			'length': 50,
+			'seqindex': 0,
+			'seqname': 'SCU49845',
+			'strand': '+'
+		}, {
+			'filename': self.gb_fname,
+			'hitstart': 3400,
+			'hitend': 3449,
+			'length': 50,
+			'seqindex': 0,
+			'seqname': 'SCU49845',
+			'strand': '-'
+		}]
+
+	def test_operon_find(self):
+		res = seqpoet_script.find_operon(self.matches, self.seqs,
+			max_distance=500)
+		assert len(res) == 2, 'expected 2 results, got {0}'.format(len(res))
+
+		assert len(res[0]['operon']) == 5
+		assert res[0]['upstream_edge']
+		assert not res[0]['downstream_edge']
+		assert res[0]['hitstart'] == 1
+		assert res[0]['hitend'] == 3158
+
+		assert len(res[1]['operon']) == 3
+		assert all(x.location.is_complement for x in res[1]['operon'])
+		assert not res[1]['upstream_edge']
+		assert not res[1]['downstream_edge']
+		assert len(res[1]['seq']) == 738
+
+	def test_operon_find_duplicates(self):
+		matches = self.matches + [dict(self.matches[0], hitstart=800,
+			hitend=849)]
+		res = seqpoet_script.find_operon(matches, self.seqs,
+			max_distance=500)
+		assert len(res) == 3, 'expected 3 results, got {0}'.format(len(res))
+		assert res[2]['seq'] is res[0]['seq']
+
+	def test_operon_find_collapse(self):
+		matches = self.matches + [dict(self.matches[0], hitstart=800,
+			hitend=849)]
+		res = seqpoet_script.find_operon(matches, self.seqs,
+			max_distance=500, collapse=True)
+		assert len(res) == 2, 'expected 2 results, got {0}'.format(len(res))
+		assert res[0]['hits'] == 2
+		assert res[1]['hits'] == 1
+
+class TestRunQuery:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		seq = self.seqs[self.gb_fname][0].seq
+		self.probe = str(seq[699:729])
+		self.primers = [str(seq[699:729]), str(seq[3399:3429].revcomp())]
+
+	def test_probe(self):
+		res = seqpoet_script.run_query({'probe': [self.probe]}, self.seqs)
+		assert res['matches'] == 1
+		assert len(res['results']) == 1
+		assert res['results'][0]['hitstart'] == 1
+		assert res['results'][0]['hitend'] == 3158
+		assert len(res['results'][0]['operon']) == 5
+		assert 'operon' in res['timings']
+
+	def test_pcr(self):
+		res = seqpoet_script.run_query({'probe': self.primers, 'pcr': True},
+			self.seqs)
+		assert len(res['results']) == 1
+		assert res['results'][0]['hitstart'] == 700
+		assert len(res['results'][0]['seq']) == 2730
+		assert 'operon' not in res['timings']
+
+	@raises(ValueError)
+	def test_pcr_single_probe(self):
+		seqpoet_script.run_query({'probe': [self.probe], 'pcr': True},
+			self.seqs)
+
+	@raises(ValueError)
+	def test_invalid_probe(self):
+		seqpoet_script.run_query({'probe': ['notdna']}, self.seqs)
+
+	@raises(ValueError)
+	def test_invalid_mismatches(self):
+		seqpoet_script.run_query({'probe': [self.probe], 'mismatches': -1},
+			self.seqs)
+
+	def test_loaded_genomes(self):
+		seqs = seqpoet_script.load_genomes(self.seqs)
+		assert seqpoet_script.is_genbank(seqs[self.gb_fname])
+		expected = seqpoet_script.run_query({'probe': [self.probe]},
+			self.seqs)['results']
+		seqpoet.instrument.reset()
+		seqpoet.instrument.enable()
+		try:
+			for _ in xrange(3):
+				res = seqpoet_script.run_query({'probe': [self.probe]}, seqs)
+				assert res['results'] == expected
+			assert seqpoet.instrument.counters['record_loaded'] == 0
+			assert seqpoet.instrument.counters['bytes_read'] == 0
+		finally:
+			seqpoet.instrument.disable()
+			seqpoet.instrument.reset()
+
+class TestSearchServer:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		self.probe = str(seqs[self.gb_fname][0].seq[699:729])
+		self.server = seqpoet_script.SearchServer(('127.0.0.1', 0), seqs)
+		self.url = 'http://127.0.0.1:{0}/'.format(
+			self.server.server_address[1])
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def teardown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_status(self):
+		res = json.load(urllib2.urlopen(self.url))
+		assert len(res['genomes']) == 1
+		assert res['genomes'][0]['genbank']
+
+	def test_query(self):
+		res = json.load(urllib2.urlopen(self.url,
+			json.dumps({'probe': [self.probe]})))
+		assert len(res['results']) == 1
+		assert res['results'][0]['strand'] == '+'
+
+	def test_bad_query(self):
+		try:
+			urllib2.urlopen(self.url, json.dumps({'probe': []}))
+		except urllib2.HTTPError as e:
+			assert e.code == 400
+		else:
+			assert False, 'expected HTTP error'
+
+class TestPairHits:
+
+	def product_pairs(self, starts, ends, end_length, min_product,
+			max_product):
+		pairs = []
+		for start, end in itertools.product(starts, ends):
+			product_length = end - start + end_length
+			if start < end and min_product <= product_length <= max_product:
+				pairs.append((start, end))
+		return pairs
+
+	def test_empty(self):
+		assert seqpoet_script.pair_hits([], [1, 2, 3], 10) == []
+		assert seqpoet_script.pair_hits([1, 2, 3], [], 10) == []
+
+	def test_product_range(self):
+		pairs = seqpoet_script.pair_hits([0, 100], [500, 300, 50], 20,
+			min_product=100, max_product=400)
+		assert pairs == [(0, 300), (100, 300)], pairs
+
+	def test_same_as_product(self):
+		rng = random.Random(42)
+		for _ in xrange(50):
+			starts = sorted(rng.sample(xrange(5000), 40))
+			ends = sorted(rng.sample(xrange(5000), 40), reverse=True)
+			min_product = rng.randint(0, 500)
+			max_product = rng.randint(min_product, 3000)
+			expected = self.product_pairs(starts, ends, 20, min_product,
+				max_product)
+			pairs = seqpoet_script.pair_hits(starts, ends, 20, min_product,
+				max_product)
+			assert pairs == expected
+
+class TestPrimerHits:
+
+	def setup(self):
+		rng = random.Random(1)
+		self.primers = [seqpoet.sequence.Sequence('acgtagctagctagcatcga'),
+			seqpoet.sequence.Sequence('ttgacgatcgatcgagc')]
+		seq = [rng.choice('acgt') for _ in xrange(20000)]
+		# Plant primer sites on both strands, some with mismatches
+		fwd = [str(x) for x in self.primers]
+		rev = [str(x.revcomp()) for x in self.primers]
+		for pos, site in [(100, fwd[0]), (900, rev[1]), (5000, fwd[1]),
+				(5600, rev[0]), (9000, fwd[0]), (15000, rev[1]),
+				(19950, fwd[0][:-1] + 'a')]:
+			seq[pos:pos + len(site)] = site
+		self.seq = seqpoet.sequence.Sequence(''.join(seq))
+
+	def pairs(self, hits, min_product, max_product):
+		pl1 = len(self.primers[0])
+		pl2 = len(self.primers[1])
+		return (seqpoet_script.pair_hits(hits[0], hits[3], pl2, min_product,
+				max_product),
+			seqpoet_script.pair_hits(hits[2], hits[1], pl1, min_product,
+				max_product))
+
+	def test_window_same_products(self):
+		for min_product, max_product in [(0, 3000), (0, 500), (800, 1000),
+				(0, 10000)]:
+			full = seqpoet_script.primer_hits(self.primers, self.seq,
+				mismatches=2, min_product=min_product,
+				max_product=max_product)
+			windowed = seqpoet_script.primer_hits(self.primers, self.seq,
+				mismatches=2, min_product=min_product,
+				max_product=max_product, window=True)
+			assert self.pairs(full, min_product, max_product) == \
+				self.pairs(windowed, min_product, max_product)
+
+	def test_window_products_found(self):
+		hits = seqpoet_script.primer_hits(self.primers, self.seq,
+			mismatches=2, max_product=3000, window=True)
+		plus, minus = self.pairs(hits, 0, 3000)
+		assert plus == [(100, 900)], plus
+		assert minus == [(5000, 5600)], minus
+
+	def test_window_rarer_primer_first(self):
+		# The longer primer has more hits in the sample, so the shorter
+		# primer is searched in the whole sequence.
+		sample = seqpoet_script.window_sample
+		seqpoet_script.window_sample = 1000
+		try:
+			full = seqpoet_script.primer_hits(self.primers, self.seq,
+				mismatches=2)
+			windowed = seqpoet_script.primer_hits(self.primers, self.seq,
+				mismatches=2, window=True)
+		finally:
+			seqpoet_script.window_sample = sample
+		assert full[2] == windowed[2]
+		assert full[3] == windowed[3]
+		assert set(windowed[0]) <= set(full[0])
+		assert set(windowed[1]) <= set(full[1])
+		assert len(windowed[0]) < len(full[0])
+
+	def test_window_whole_sequence_sample(self):
+		full = seqpoet_script.primer_hits(self.primers, self.seq,
+			mismatches=2)
+		windowed = seqpoet_script.primer_hits(self.primers, self.seq,
+			mismatches=2, window=True)
+		assert full[0] == windowed[0]
+		assert full[2] == windowed[2]
+
+class TestMatchMultiplex:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		seq = self.seqs[self.gb_fname][0].seq
+		self.panel = [seq[699:729], seq[3399:3429].revcomp(),
+			seq[1999:2029].revcomp()]
+
+	def test_pair_same_as_match_primer(self):
+		res = seqpoet_script.match_multiplex(self.panel[:2], self.seqs)
+		expected = seqpoet_script.match_primer(self.panel[:2], self.seqs)
+		assert len(res) == len(expected) == 1
+		for key in ['hitstart', 'length', 'strand', 'seq']:
+			assert res[0][key] == expected[0][key], key
+		assert res[0]['primers'] == (0, 1)
+
+	def test_panel(self):
+		res = seqpoet_script.match_multiplex(self.panel, self.seqs)
+		assert len(res) == 2, 'expected 2 products, got {0}'.format(len(res))
+		assert [x['primers'] for x in res] == [(0, 2), (0, 1)]
+		assert [x['length'] for x in res] == [1330, 2730]
+		assert all(x['hitstart'] == 700 for x in res)
+		assert res[0]['hitend'] == 2029
+
+	def test_panel_product_range(self):
+		res = seqpoet_script.match_multiplex(self.panel, self.seqs,
+			max_product=2000)
+		assert len(res) == 1
+		assert res[0]['primers'] == (0, 2)
+
+	def test_panel_strand(self):
+		res = seqpoet_script.match_multiplex(self.panel[::-1], self.seqs)
+		assert [x['primers'] for x in res] == [(2, 0), (2, 1)]
+		assert all(x['strand'] == '-' for x in res)
+		assert res[0]['seq'] == self.seqs[self.gb_fname][0].seq[699:2029] \
+			.revcomp()
+
+class TestFMIndexSearch:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		seq = self.seqs[self.gb_fname][0].seq
+		self.indexes = {
+			self.gb_fname: [seqpoet.fmindex.FMIndex(seq)]
+		}
+		self.seq = seq
+		self.primers = [seq[699:729], seq[3399:3429].revcomp()]
+
+	def test_indexed_hits(self):
+		index = self.indexes[self.gb_fname][0]
+		rng = random.Random(1)
+		for _ in xrange(10):
+			start = rng.randint(0, len(self.seq) - 12)
+			needle = self.seq[start:start + 12]
+			expected = seqpoet_script.primer_hits([needle, needle], self.seq,
+				mismatches=1)[:2]
+			assert seqpoet_script.indexed_hits(needle, index,
+				mismatches=1) == expected
+
+	def test_match_probe(self):
+		probe = self.seq[0:20]
+		expected = seqpoet_script.match_probe(probe, self.seqs)
+		res = seqpoet_script.match_probe(probe, self.seqs,
+			indexes=self.indexes)
+		assert res == expected
+
+	def test_match_primer(self):
+		expected = seqpoet_script.match_primer(self.primers, self.seqs)
+		res = seqpoet_script.match_primer(self.primers, self.seqs,
+			indexes=self.indexes)
+		assert len(res) == 1
+		assert res == expected
+
+	def test_match_multiplex(self):
+		panel = self.primers + [self.seq[1999:2029].revcomp()]
+		expected = seqpoet_script.match_multiplex(panel, self.seqs)
+		res = seqpoet_script.match_multiplex(panel, self.seqs,
+			indexes=self.indexes)
+		assert res == expected
+
+class TestRunStats:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		seq = self.seqs[self.gb_fname][0].seq
+		self.probe = seq[699:729]
+		self.stats = seqpoet_script.RunStats()
+
+	def test_search_counters(self):
+		matches = seqpoet_script.match_probe(self.probe, self.seqs,
+			stats=self.stats)
+		report = self.stats.report()
+		search = report['stages']['search']
+		assert search['records'] == 1
+		assert search['hits'] == len(matches) == 1
+		assert search['bases_scanned'] == 5028
+		assert search['files'][self.gb_fname]['hits'] == 1
+		assert search['wall'] >= 0 and search['cpu'] >= 0
+
+	def test_parse_counters(self):
+		seqpoet_script.get_single_sequence(self.gb_fname, stats=self.stats)
+		parse = self.stats.report()['stages']['parse']
+		assert parse['records'] == 1
+		assert parse['bytes_read'] == os.path.getsize(self.gb_fname)
+
+	def test_stages_sum(self):
+		for _ in xrange(2):
+			with self.stats.stage('write') as counters:
+				counters['records'] += 3
+		report = self.stats.report()
+		assert report['stages']['write']['records'] == 6
+		assert 'files' not in report['stages']['write']
+		json.dumps(report)
+
+	def test_no_stats(self):
+		with seqpoet_script.timed(None, 'search') as counters:
+			counters['hits'] += 1
+
+class TestOpenFasta:
+
+	def setup(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.fname = os.path.join(self.tempdir, 'valid.fasta')
+		shutil.copy(os.path.join(currentdir, 'data', 'valid_noindex.fasta'),
+			self.fname)
+
+	def teardown(self):
+		shutil.rmtree(self.tempdir)
+
+	def test_indexed(self):
+		f = seqpoet_script.open_fasta(self.fname)
+		assert isinstance(f, seqpoet.Fasta)
+		assert os.path.isfile(self.fname + '.fidx')
+		probe = f[0].seq[10:40]
+		matches = seqpoet_script.match_probe(probe, {self.fname: f},
+			mismatches=0)
+		assert len(matches) == 1
+		assert matches[0].source is f
+		assert str(matches[0]['seq']) == str(probe)
+
+	def test_uneven(self):
+		fname = os.path.join(self.tempdir, 'uneven.fasta')
+		shutil.copy(os.path.join(currentdir, 'data', 'uneven.fasta'), fname)
+		f = seqpoet_script.open_fasta(fname)
+		assert isinstance(f, seqpoet.FastaReader)
+		assert [x.name for x in f] == ['chr1', 'chr2', 'chr3']
+
+	def test_gzip(self):
+		fname = self.fname + '.gz'
+		with open(self.fname) as f, gzip.open(fname, 'wb') as out:
+			out.write(f.read())
+		stats = seqpoet_script.RunStats()
+		f = seqpoet_script.get_single_sequence(fname, genbank_only=False,
+			stats=stats)
+		assert isinstance(f, seqpoet.FastaReader)
+		assert 'records' not in stats.report()['stages']['parse']
+		probe = seqpoet.Fasta(self.fname)[0].seq[10:40]
+		matches = seqpoet_script.match_probe(probe, {fname: f}, mismatches=0,
+			stats=stats)
+		assert matches[0].source is None
+		assert str(matches[0]['seq']) == str(probe)
+		assert stats.report()['stages']['search']['records'] == 4
+
+	@raises(ValueError)
+	def test_not_fasta(self):
+		fname = os.path.join(self.tempdir, 'text.fasta')
+		with open(fname, 'w') as f:
+			f.write('not a FASTA file\n')
+		seqpoet_script.open_fasta(fname)
+
+class TTYStringIO(StringIO.StringIO):
+
+	def isatty(self):
+		return True
+
+class TestProgress:
+
+	def setup(self):
+		self.gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		self.seqs = {
+			self.gb_fname: seqpoet.genbank.GenBank(self.gb_fname)
+		}
+		self.probe = self.seqs[self.gb_fname][0].seq[699:729]
+
+	def test_log(self):
+		f = StringIO.StringIO()
+		progress = seqpoet_script.Progress(self.seqs.keys(), f=f)
+		seqpoet_script.match_probe(self.probe, self.seqs, progress=progress)
+		assert f.getvalue() == ''
+		progress.finish()
+		assert f.getvalue().startswith('1/1 files, ')
+		assert f.getvalue().endswith('1 hit, ETA 0:00:00\n')
+
+	def test_tty(self):
+		f = TTYStringIO()
+		progress = seqpoet_script.Progress(self.seqs.keys(), f=f,
+			interval=0)
+		seqpoet_script.match_probe(self.probe, self.seqs, progress=progress)
+		progress.finish()
+		lines = f.getvalue().split('\r\x1b[K')
+		assert lines[0] == ''
+		assert lines[1].startswith('0/1 files, ')
+		assert lines[1].endswith('ETA ?')
+		assert lines[-1].endswith('1 hit, ETA 0:00:00\n')
+
+	def test_format_duration(self):
+		assert seqpoet_script.format_duration(0) == '0:00:00'
+		assert seqpoet_script.format_duration(3725.5) == '1:02:05'
+
+class TestDeduplication:
+
+	def setup(self):
+		gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		gb = seqpoet.genbank.GenBank(gb_fname)
+		record = gb[0]
+		self.fasta = StringIO.StringIO(str(seqpoet.FastaRecord(record.seq,
+			'copy')) + '\n')
+		self.fasta.name = 'copy.fasta'
+		self.seqs = {
+			gb_fname: gb,
+			'copy.fasta': seqpoet.FastaReader(self.fasta)
+		}
+		self.probe = record.seq[699:729]
+		self.primers = [record.seq[699:729], record.seq[3399:3429].revcomp()]
+		self.stats = seqpoet_script.RunStats()
+
+	def test_probe(self):
+		matches = seqpoet_script.match_probe(self.probe, self.seqs,
+			stats=self.stats)
+		assert sorted(x['seqname'] for x in matches) == ['SCU49845', 'copy']
+		assert matches[0]['seq'] == matches[1]['seq']
+		search = self.stats.report()['stages']['search']
+		assert search['bases_scanned'] == 5028
+		assert search['bases_deduplicated'] == 5028
+
+	def test_primer(self):
+		matches = seqpoet_script.match_primer(self.primers, self.seqs,
+			stats=self.stats)
+		assert len(matches) == 2
+		assert matches[0]['hitstart'] == matches[1]['hitstart'] == 700
+
+	def test_multiplex(self):
+		matches = seqpoet_script.match_multiplex(self.primers, self.seqs,
+			stats=self.stats)
+		assert len(matches) == 2
+		assert self.stats.report()['stages']['search']['bases_scanned'] == \
+			5028
+
+class TestParsingFailure:
+
+	def setup(self):
+		gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		dups_fname = os.path.join(currentdir, 'data', 'dups_noindex.fasta')
+		gb = seqpoet.genbank.GenBank(gb_fname)
+		self.seqs = collections.OrderedDict([
+			(dups_fname, seqpoet.FastaReader(dups_fname)),
+			(gb_fname, gb)
+		])
+		self.gb_fname = gb_fname
+		self.probe = gb[0].seq[699:729]
+		self.primers = [gb[0].seq[699:729], gb[0].seq[3399:3429].revcomp()]
+		self.done = []
+
+	def on_file(self, fname, matches):
+		self.done.append(fname)
+
+	def test_probe(self):
+		matches = seqpoet_script.match_probe(self.probe, self.seqs,
+			on_file=self.on_file)
+		assert len(matches) == 1
+		assert matches[0].filename == self.gb_fname
+		assert self.done == [self.gb_fname]
+
+	def test_primer(self):
+		matches = seqpoet_script.match_primer(self.primers, self.seqs,
+			on_file=self.on_file)
+		assert len(matches) == 1
+		assert self.done == [self.gb_fname]
+
+	def test_multiplex(self):
+		matches = seqpoet_script.match_multiplex(self.primers, self.seqs,
+			on_file=self.on_file)
+		assert len(matches) == 1
+		assert self.done == [self.gb_fname]
+
+class TestCachedSearch:
+
+	def setup(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.gb_fname = os.path.join(self.tempdir, 'U49845.gb')
+		shutil.copy(os.path.join(currentdir, 'data', 'U49845.gb'),
+			self.gb_fname)
+		self.seqs = {self.gb_fname: seqpoet.GenBank(self.gb_fname)}
+		self.probe = self.seqs[self.gb_fname][0].seq[699:729]
+		self.cache = seqpoet.cache.ResultCache(
+			os.path.join(self.tempdir, 'results'))
+		self.searched = []
+
+	def teardown(self):
+		shutil.rmtree(self.tempdir)
+
+	def search(self, seqs, on_file=None):
+		self.searched.append(sorted(seqs))
+		return seqpoet_script.match_probe(self.probe, seqs, on_file=on_file)
+
+	def test_cached(self):
+		query = ('probe', (str(self.probe),), 2, None, False)
+		first = seqpoet_script.cached_search(self.search, self.seqs,
+			[('result cache', self.cache)], query)
+		second = seqpoet_script.cached_search(self.search, self.seqs,
+			[('result cache', self.cache)], query)
+		assert self.searched == [[self.gb_fname]]
+		assert first == second
+		assert second[0]['filename'] == self.gb_fname
+
+	def test_other_query(self):
+		caches = [('result cache', self.cache)]
+		seqpoet_script.cached_search(self.search, self.seqs, caches,
+			('probe', (str(self.probe),), 2, None, False))
+		seqpoet_script.cached_search(self.search, self.seqs, caches,
+			('probe', (str(self.probe),), 1, None, False))
+		assert len(self.searched) == 2
+
+	def test_checkpoint(self):
+		query = ('probe', (str(self.probe),), 2, None, False)
+		fname = os.path.join(self.tempdir, 'checkpoint')
+		checkpoint = seqpoet.cache.Checkpoint(fname, query)
+		first = seqpoet_script.cached_search(self.search, self.seqs,
+			[('checkpoint', checkpoint), ('result cache', self.cache)], query)
+		checkpoint.close()
+		checkpoint = seqpoet.cache.Checkpoint(fname, query, resume=True)
+		second = seqpoet_script.cached_search(self.search, self.seqs,
+			[('checkpoint', checkpoint)], query)
+		checkpoint.close()
+		assert self.searched == [[self.gb_fname]]
+		assert first == second
+		assert self.cache.load(query, self.gb_fname) is not None
+
+class TestShard:
+
+	def setup(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.files = []
+		for i in xrange(20):
+			fname = os.path.join(self.tempdir, 'genome{0}.gb'.format(i))
+			with open(fname, 'w') as f:
+				f.write('a' * (i * 100))
+			self.files.append(fname)
+
+	def teardown(self):
+		shutil.rmtree(self.tempdir)
+
+	def test_parse_shard(self):
+		assert seqpoet_script.parse_shard('2/5') == (2, 5)
+
+	@raises(Exception)
+	def test_parse_shard_out_of_range(self):
+		seqpoet_script.parse_shard('6/5')
+
+	def test_partition(self):
+		for balance in ['hash', 'size']:
+			shards = [seqpoet_script.shard_files(self.files, i, 4,
+				balance=balance) for i in xrange(1, 5)]
+			assert sorted(sum(shards, [])) == sorted(self.files)
+			assert all(x == sorted(x) for x in shards)
+			assert seqpoet_script.shard_files(list(reversed(self.files)), 2,
+				4, balance=balance) == shards[1]
+
+	def test_size_balanced(self):
+		shards = [seqpoet_script.shard_files(self.files, i, 4,
+			balance='size') for i in xrange(1, 5)]
+		sizes = [sum(os.path.getsize(x) for x in shard) for shard in shards]
+		assert max(sizes) - min(sizes) <= 1900
+
+	def test_hash_stable(self):
+		shard = seqpoet_script.shard_files(self.files, 1, 4)
+		kept = [x for x in self.files if x not in shard][:5] + shard
+		assert seqpoet_script.shard_files(kept, 1, 4) == shard
+
+	def test_empty_shard(self):
+		# None of the files can be parsed as GenBank files, except for
+		# the empty one.
+		os.remove(self.files[0])
+		assert seqpoet_script.get_sequences(self.tempdir, genbank_only=True,
+			shard=(1, 4)) == {}
+
+	@raises(SystemExit)
+	def test_no_files(self):
+		os.remove(self.files[0])
+		seqpoet_script.get_sequences(self.tempdir, genbank_only=True)
+
+class TestMerge:
+
+	def setup(self):
+		self.tempdir = tempfile.mkdtemp()
+
+	def teardown(self):
+		shutil.rmtree(self.tempdir)
+
+	def test_read_fasta_records(self):
+		fname = os.path.join(self.tempdir, 'out.fasta')
+		with open(fname, 'w') as f:
+			f.write('>b.gb:x:1:4:2:+\nacgt\n>b.gb:x:1:4:2:+\nac\ngt\n')
+		assert seqpoet_script.read_fasta_records(fname) == \
+			[('b.gb:x:1:4:2:+', 'acgt'), ('b.gb:x:1:4:2:+', 'acgt')]
+
+	def test_merge_reports(self):
+		reports = []
+		for fname in ['a.gb', 'b.gb']:
+			stats = seqpoet_script.RunStats()
+			with stats.stage('search', fname) as counters:
+				counters['bases_scanned'] += 100
+				counters['hits'] += 1
+			reports.append(json.loads(json.dumps(stats.report())))
+		merged = seqpoet_script.merge_reports(reports)
+		assert merged['shards'] == 2
+		search = merged['stages']['search']
+		assert search['bases_scanned'] == 200
+		assert search['hits'] == 2
+		assert search['files'].keys() == ['a.gb', 'b.gb']
+
+class TestParallelSearch:
+
+	def setup(self):
+		gb_fname = os.path.join(currentdir, 'data', 'U49845.gb')
+		fasta_fname = os.path.join(currentdir, 'data', 'valid_index.fasta')
+		self.seqs = collections.OrderedDict([
+			(gb_fname, seqpoet.GenBank(gb_fname)),
+			(fasta_fname, seqpoet.Fasta(fasta_fname))
+		])
+		self.probe = self.seqs[gb_fname][0].seq[699:729]
+
+	def test_same_matches(self):
+		search = functools.partial(seqpoet_script.match_probe, self.probe)
+		stats = seqpoet_script.RunStats()
+		done = []
+		matches = seqpoet_script.parallel_search(search, self.seqs, 2,
+			stats=stats, on_file=lambda fname, m: done.append(fname))
+		assert matches == search(self.seqs)
+		assert matches[0].source is self.seqs[matches[0].filename]
+		assert str(matches[0]['seq']) == str(self.probe)
+		assert sorted(done) == sorted(self.seqs)
+		assert stats.report()['stages']['search']['records'] == 5
+
+	def test_deduplicated(self):
+		gb_fname, gb = self.seqs.items()[0]
+		fasta = StringIO.StringIO(str(seqpoet.FastaRecord(gb[0].seq,
+			'copy')) + '\n')
+		fasta.name = 'copy.fasta'
+		self.seqs['copy.fasta'] = seqpoet.FastaReader(fasta)
+		search = functools.partial(seqpoet_script.match_probe, self.probe)
+		serial_stats = seqpoet_script.RunStats()
+		serial = search(self.seqs, stats=serial_stats)
+		fasta.seek(0)
+		stats = seqpoet_script.RunStats()
+		matches = seqpoet_script.parallel_search(search, self.seqs, 2,
+			stats=stats)
+		assert matches == serial
+		assert [x.seqname for x in matches] == ['SCU49845', 'copy']
+		assert str(matches[1]['seq']) == str(self.probe)
+		for key in ['bases_scanned', 'bases_deduplicated', 'hits']:
+			assert stats.report()['stages']['search'][key] == \
+				serial_stats.report()['stages']['search'][key]
+		assert stats.report()['stages']['search']['bases_deduplicated'] == \
+			5028
+
+	def test_instrument(self):
+		search = functools.partial(seqpoet_script.match_probe, self.probe)
+		seqpoet.instrument.reset()
+		seqpoet.instrument.enable()
+		try:
+			search(self.seqs)
+			serial = seqpoet.instrument.snapshot()
+			seqpoet.instrument.reset()
+			seqpoet_script.parallel_search(search, self.seqs, 2)
+			parallel = seqpoet.instrument.snapshot()
+		finally:
+			seqpoet.instrument.disable()
+			seqpoet.instrument.reset()
+		assert parallel['counters']['window_scanned'] == \
+			serial['counters']['window_scanned'] > 0
+		assert parallel['calls']['search.search'] == \
+			serial['calls']['search.search']
+
+	def test_parsing_failure(self):
+		dups_fname = os.path.join(currentdir, 'data', 'dups_noindex.fasta')
+		self.seqs[dups_fname] = seqpoet.FastaReader(dups_fname)
+		search = functools.partial(seqpoet_script.match_probe, self.probe)
+		done = []
+		matches = seqpoet_script.parallel_search(search, self.seqs, 2,
+			on_file=lambda fname, m: done.append(fname))
+		assert matches == search(self.seqs)
+		assert dups_fname not in done
+
+class TestStoredFilter:
+
+	def setup(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.fnames = []
+		for name in ['a.gb', 'b.gb']:
+			fname = os.path.join(self.tempdir, name)
+			shutil.copy(os.path.join(currentdir, 'data', 'U49845.gb'), fname)
+			self.fnames.append(fname)
+		gb = seqpoet.GenBank(self.fnames[0])
+		self.probe = gb[0].seq[699:729]
+		self.absent = seqpoet.Sequence('gatcgatcgtacgtagctagcatcgactagc')
+		seqpoet.bloom.genome_filter(gb)
+
+	def teardown(self):
+		shutil.rmtree(self.tempdir)
+
+	def test_check(self):
+		check = seqpoet_script.check_stored_filter
+		assert check(self.fnames[0], [self.probe], mismatches=0) is True
+		assert check(self.fnames[0], [self.absent], mismatches=0) is False
+		assert check(self.fnames[1], [self.absent], mismatches=0) is None
+
+	def test_skipped_before_parsing(self):
+		checked = {}
+		def keep(fname):
+			checked[fname] = seqpoet_script.check_stored_filter(fname,
+				[self.absent], mismatches=0)
+			return checked[fname] is not False
+		seqs = seqpoet_script.get_sequences(self.tempdir, keep=keep)
+		assert seqs.keys() == [self.fnames[1]]
+		kept = seqpoet_script.prefilter(seqs, [self.absent], mismatches=0,
+			checked=checked)
+		assert len(kept) == 0
@@ -1,10 +1,12 @@
 from collections import defaultdict
+import cPickle
 import os
 
 from nose.tools import raises
 from nose.plugins.skip import SkipTest
 
-from seqpoet.search import search, hamming_distance
+from seqpoet.search import search, search_windows, merge_windows, \
+    hamming_distance, Match
 from seqpoet import Sequence
 from seqpoet import GenBank
 from seqpoet.genbank import Location
@@ -50,6 +52,25 @@ class TestSearch:
         res = search('ggg', self.haystack, mismatches=1)
         assert res == [3, 7, 8, 9, 14, 15, 16], 'found {0}'.format(str(res))
 
+    def test_search_windows(self):
+        res = search_windows('ggg', self.haystack, [(0, 10)], mismatches=1)
+        assert res == [3, 7, 8, 9], 'found {0}'.format(str(res))
+
+        res = search_windows('ggg', self.haystack, [(15, 40), (-5, 4)],
+            mismatches=1)
+        assert res == [3, 15, 16], 'found {0}'.format(str(res))
+
+    def test_search_windows_same_as_search(self):
+        full = search('ca', self.haystack, mismatches=1)
+        res = search_windows('ca', self.haystack, [(0, len(self.haystack))],
+            mismatches=1)
+        assert res == full, 'found {0}'.format(str(res))
+
+    def test_merge_windows(self):
+        assert merge_windows([]) == []
+        assert merge_windows([(10, 20), (0, 5), (5, 7), (15, 30), (8, 8)]) \
+            == [(0, 7), (10, 30)]
+
     def test_search_genbank(self):
         if not os.path.exists(self.genbankdir):
             raise SkipTest
@@ -67,3 +88,51 @@ class TestSearch:
             for s in starts:
                 for gbl in gb.get_locus_from_name(locus):
                     assert gbl.seq[s:s + len(probe)] == probe
+
+class TestMatch:
+
+    def setUp(self):
+        testdir = os.path.dirname(__file__)
+        self.gb = GenBank(os.path.join(testdir, 'data', 'U49845.gb'))
+        self.seq = self.gb[0].seq
+
+    def match(self, strand='+', revcomp=False, primers=None):
+        return Match(self.gb.filename, 'SCU49845', 0, 701, 730, 30, strand,
+            primers=primers, revcomp=revcomp, source=self.gb)
+
+    def test_lazy_sequence(self):
+        assert self.match()['seq'] == self.seq[700:730]
+        assert self.match('-', revcomp=True).seq == \
+            self.seq[700:730].revcomp()
+
+    def test_extract(self):
+        m = Match('-', 'x', 0, 3, 6, 4, '+')
+        assert m.extract(Sequence('acgtacgt')) == 'gtac'
+        assert m.seq == 'gtac'
+
+    @raises(ValueError)
+    def test_no_source(self):
+        Match('-', 'x', 0, 3, 6, 4, '+').seq
+
+    def test_dictionary(self):
+        m = self.match()
+        assert m['hitstart'] == 701
+        assert 'primers' not in m
+        assert 'primers' in self.match(primers=(0, 1))
+        assert sorted(dict(m)) == ['filename', 'hitend', 'hitstart',
+            'length', 'seq', 'seqindex', 'seqname', 'strand']
+        m['filename'] = 'U49845.gb'
+        assert m.filename == 'U49845.gb'
+        assert '{filename}:{seqname}:{hitstart}'.format(**m) == \
+            'U49845.gb:SCU49845:701'
+
+    @raises(KeyError)
+    def test_missing_key(self):
+        self.match()['source']
+
+    def test_pickle(self):
+        m = cPickle.loads(cPickle.dumps(self.match(), 2))
+        assert m.source is None
+        assert m == self.match()
+        m.attach(self.gb)
+        assert m.seq == self.seq[700:730]
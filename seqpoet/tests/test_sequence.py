@@ -48,6 +48,12 @@ class TestSequence:
         assert s == self.seq1.lower()
         assert s[:3] == seqpoet.Sequence(self.seq1[:3])
 
+    def test_checksum(self):
+        s = seqpoet.Sequence(self.seq1)
+        assert s.checksum() == seqpoet.Sequence(self.seq1.lower()).checksum()
+        assert s.checksum() != s.revcomp().checksum()
+        assert len(s.checksum()) == 32
+
     @raises(ValueError)
     def test_illegal_characters(self):
         s = seqpoet.Sequence(self.illegal)
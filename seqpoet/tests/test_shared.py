@@ -0,0 +1,73 @@
+import cPickle
+import os
+
+from nose.tools import raises
+
+import seqpoet
+from seqpoet.shared import SharedGenomes
+
+class TestSharedGenomes:
+
+    def setUp(self):
+        testdir = os.path.join(os.path.dirname(__file__), 'data')
+        self.gb = seqpoet.GenBank(os.path.join(testdir, 'U49845.gb'))
+        self.fasta = seqpoet.Fasta(os.path.join(testdir, 'valid_index.fasta'))
+        self.seqs = {
+            self.gb.filename: self.gb,
+            self.fasta.filename: self.fasta
+        }
+        self.genomes = SharedGenomes.create(self.seqs)
+
+    def tearDown(self):
+        self.genomes.close()
+
+    def test_registry(self):
+        assert set(self.genomes.registry) == set(self.seqs)
+        entries = self.genomes.registry[self.fasta.filename]
+        assert [x.name for x in entries] == \
+            [x.name for x in self.fasta]
+        assert [x.length for x in entries] == \
+            [len(x.seq) for x in self.fasta]
+
+    def test_failed(self):
+        fname = os.path.join(os.path.dirname(__file__), 'data',
+            'dups_noindex.fasta')
+        self.seqs[fname] = seqpoet.FastaReader(fname)
+        with SharedGenomes.create(self.seqs) as genomes:
+            assert fname not in genomes.registry
+            assert genomes.failed.keys() == [fname]
+            assert os.path.getsize(genomes.filename) == \
+                sum(x.length for entries in genomes.registry.itervalues()
+                    for x in entries)
+
+    def test_records(self):
+        for fname, seqfile in self.seqs.iteritems():
+            genome = self.genomes.genome(fname)
+            assert genome.filename == fname
+            assert len(genome) == len(seqfile)
+            for i, record in enumerate(genome):
+                assert record.name == seqfile[i].name
+                assert record.seq == seqfile[i].seq
+                assert genome.checksum(i) == record.seq.checksum()
+
+    def test_fetch(self):
+        seq = str(self.gb[0].seq)
+        assert self.genomes.fetch(self.gb.filename, 0, 100, 130) == \
+            seq[100:130]
+        assert self.genomes.fetch(self.gb.filename, 0, 5000) == seq[5000:]
+        assert self.genomes.fetch(self.gb.filename, 0, 10, 5) == ''
+
+    def test_pickle(self):
+        genomes = cPickle.loads(cPickle.dumps(self.genomes, 2))
+        assert genomes.fetch(self.gb.filename, 0, 0, 10) == \
+            str(self.gb[0].seq[:10])
+        genomes.close()
+        assert os.path.exists(self.genomes.filename)
+
+    def test_close(self):
+        self.genomes.close()
+        assert not os.path.exists(self.genomes.filename)
+
+    @raises(KeyError)
+    def test_missing_genome(self):
+        self.genomes.genome('missing.gb')
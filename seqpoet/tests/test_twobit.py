@@ -0,0 +1,95 @@
+import os
+import random
+import shutil
+import struct
+import tempfile
+
+from nose.tools import raises
+
+import seqpoet
+from seqpoet.twobit import TwoBit, is_twobit, write_twobit
+
+class TestTwoBit:
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tempdir, 'test.2bit')
+        rng = random.Random(0)
+        self.records = [
+            seqpoet.FastaRecord('acgtnnnnacgtac', 'first'),
+            seqpoet.FastaRecord('', 'empty'),
+            seqpoet.FastaRecord(''.join(rng.choice('acgt') \
+                for _ in xrange(1001)), 'random'),
+            seqpoet.FastaRecord('nnnacgn', 'edges')
+        ]
+        write_twobit(self.records, self.fname)
+        self.rng = rng
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_is_twobit(self):
+        assert is_twobit(self.fname)
+        testdir = os.path.dirname(__file__)
+        assert not is_twobit(os.path.join(testdir, 'data', 'U49845.gb'))
+
+    def test_records(self):
+        tb = TwoBit(self.fname)
+        assert len(tb) == 4
+        assert tb.names == ['first', 'empty', 'random', 'edges']
+        assert list(tb.lengths) == [14, 0, 1001, 7]
+        for record, expected in zip(tb, self.records):
+            assert record.name == expected.name
+            assert record.seq == expected.seq
+
+    def test_get_record(self):
+        tb = TwoBit(self.fname)
+        assert tb[3].seq == 'nnnacgn'
+        assert tb.get_record_by_name('first').seq == 'acgtnnnnacgtac'
+
+    @raises(KeyError)
+    def test_missing_name(self):
+        TwoBit(self.fname).get_record_by_name('missing')
+
+    def test_fetch(self):
+        tb = TwoBit(self.fname)
+        for i, record in enumerate(self.records):
+            seq = str(record.seq)
+            for _ in xrange(50):
+                start = self.rng.randint(0, len(seq))
+                end = self.rng.randint(start, len(seq))
+                assert tb.fetch(i, start, end) == seq[start:end]
+        assert tb.fetch('first', 2, 6) == 'gtnn'
+        assert tb.fetch('first', 10) == 'gtac'
+
+    def test_size(self):
+        # Four bases per byte.
+        assert os.path.getsize(self.fname) < 1001 // 4 + 200
+
+    def test_big_endian(self):
+        # Files written on big endian machines are read as well.
+        fname = os.path.join(self.tempdir, 'big.2bit')
+        with open(fname, 'wb') as f:
+            f.write(struct.pack('>IIII', 0x1A412743, 0, 1, 0))
+            f.write(chr(3) + 'seq' + struct.pack('>I', 24))
+            f.write(struct.pack('>IIII', 6, 0, 0, 0))
+            f.write(chr(0b10010011) + chr(0b00000000))
+        tb = TwoBit(fname)
+        assert tb[0].seq == 'actgtt'
+
+    def test_from_genbank(self):
+        testdir = os.path.dirname(__file__)
+        gb = seqpoet.GenBank(os.path.join(testdir, 'data', 'U49845.gb'))
+        write_twobit(gb, self.fname)
+        tb = TwoBit(self.fname)
+        assert tb.names == ['SCU49845']
+        assert tb[0].seq == gb[0].seq
+
+    @raises(ValueError)
+    def test_duplicate_names(self):
+        write_twobit(self.records + self.records[:1], self.fname)
+
+    @raises(ValueError)
+    def test_invalid_file(self):
+        testdir = os.path.dirname(__file__)
+        TwoBit(os.path.join(testdir, 'data', 'U49845.gb'))
@@ -0,0 +1,229 @@
+#-*- encoding: utf-8 -*-
+"""Classes and functions for reading and writing UCSC .2bit files.
+
+A .2bit file stores four bases per byte, together with the positions of
+runs of N, so it is about a fourth of the size of a FASTA file and any
+region of a sequence can be read without reading what comes before it.
+
+.. module:: twobit
+.. moduleauthor:: Niklas Mähler <niklas.mahler@gmail.com>
+"""
+
+import array
+import itertools
+import re
+import struct
+
+from seqpoet import instrument
+from seqpoet.fasta import FastaRecord
+from seqpoet.sequence import Sequence
+
+#: The signature at the start of a .2bit file.
+signature = 0x1A412743
+
+#: The bases in the order of their 2-bit codes.
+_bases = 'tcag'
+
+#: Decoded bases for every byte value.
+_decode = [''.join(x) for x in itertools.product(_bases, repeat=4)]
+
+#: Byte values for every group of four bases.
+_encode = dict((x, chr(i)) for i, x in enumerate(_decode))
+
+def is_twobit(fname):
+    """Check whether a file is a .2bit file.
+
+    :param fname: filename.
+    :returns: True if the file starts with the .2bit signature.
+    """
+    with open(fname, 'rb') as f:
+        header = f.read(4)
+    if len(header) < 4:
+        return False
+    return signature in (struct.unpack('<I', header)[0],
+        struct.unpack('>I', header)[0])
+
+class TwoBit(object):
+
+    """Represent a .2bit file.
+
+    A TwoBit object behaves like a :py:class:`.Fasta` object. Only the
+    names and positions of the sequences are read when the object is
+    created, and the sequences are read when they are requested.
+    Soft-masking is not kept, since all sequences are lower case.
+
+    **Class attributes:**
+
+        - **filename:** the filename of the .2bit file.
+        - **names:** the sequence names, in file order.
+        - **lengths:** an array with the sequence lengths.
+
+    :param fname: filename of the .2bit file.
+    :raises: ValueError if the file is not a valid .2bit file.
+    """
+
+    def __init__(self, fname):
+        self.filename = fname
+        self.names = []
+        self.lengths = array.array('l')
+        self.positions = {}
+        self._offsets = []
+        self._nblocks = []
+
+        with open(fname, 'rb') as f:
+            header = f.read(16)
+            if len(header) < 16:
+                raise ValueError('invalid .2bit file: {0}'.format(fname))
+            for order in '<>':
+                if struct.unpack(order + 'I', header[:4])[0] == signature:
+                    break
+            else:
+                raise ValueError('invalid .2bit file: {0}'.format(fname))
+            self._order = order
+            version, count = struct.unpack(order + 'II', header[4:12])
+            if version != 0:
+                raise ValueError('unsupported .2bit version: {0}'.format(
+                    version))
+
+            for i in xrange(count):
+                name = f.read(ord(f.read(1)))
+                self.positions[name] = i
+                self.names.append(name)
+                self._offsets.append(self._unpack(f, 1)[0])
+
+            for offset in self._offsets:
+                f.seek(offset)
+                length, nblock_count = self._unpack(f, 2)
+                starts = self._unpack(f, nblock_count)
+                sizes = self._unpack(f, nblock_count)
+                mask_count = self._unpack(f, 1)[0]
+                self.lengths.append(length)
+                self._nblocks.append(zip(starts, sizes))
+                # Skip the mask blocks and the reserved field.
+                self._offsets[len(self._nblocks) - 1] = \
+                    offset + 16 + 8 * (nblock_count + mask_count)
+
+    def _unpack(self, f, n):
+        """Read n 32-bit integers."""
+        return struct.unpack('{0}{1}I'.format(self._order, n), f.read(4 * n))
+
+    def fetch(self, key, start=0, end=None):
+        """Get a region of a sequence.
+
+        Only the bytes holding the region are read from the file.
+
+        :param key: the position or the name of the sequence.
+        :param start: the start of the region (0-based, including).
+        :param end: the end of the region (0-based, excluding). If
+                    ``None``, the region extends to the end of the
+                    sequence.
+        :returns: a :py:class:`.Sequence` object.
+        :raises: IndexError or KeyError if there is no such sequence.
+        """
+        if isinstance(key, basestring):
+            key = self.positions[key]
+        length = self.lengths[key]
+        if end is None or end > length:
+            end = length
+        start = max(0, start)
+        if start >= end:
+            return Sequence('')
+
+        first = start // 4
+        with open(self.filename, 'rb') as f:
+            f.seek(self._offsets[key] + first)
+            packed = f.read((end + 3) // 4 - first)
+        if instrument.enabled:
+            instrument.emit('bytes_read', len(packed), filename=self.filename)
+        seq = ''.join([_decode[x] for x in bytearray(packed)])
+        seq = seq[start - 4 * first:end - 4 * first]
+
+        nblocks = [(max(s, start), min(s + n, end)) \
+            for s, n in self._nblocks[key] if s < end and s + n > start]
+        if len(nblocks) > 0:
+            seq = list(seq)
+            for s, e in nblocks:
+                seq[s - start:e - start] = 'n' * (e - s)
+            seq = ''.join(seq)
+
+        return Sequence(seq)
+
+    def get_record(self, key):
+        """Get a single record.
+
+        :param key: an integer.
+        :returns: a :py:class:`.FastaRecord` object.
+        :raises: IndexError if there is no record at key.
+        """
+        record = FastaRecord(self.fetch(key), self.names[key])
+        if instrument.enabled:
+            instrument.emit('record_loaded', filename=self.filename,
+                name=record.name, length=len(record.seq))
+        return record
+
+    def get_record_by_name(self, name):
+        """Get a single record by its name.
+
+        :param name: the name of the record.
+        :returns: a :py:class:`.FastaRecord` object.
+        :raises: KeyError if there is no record with that name.
+        """
+        return self.get_record(self.positions[name])
+
+    def __getitem__(self, key):
+        return self.get_record(key)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.get_record(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return '<TwoBit for {0}>'.format(self.filename)
+
+def _pack(seq):
+    """Pack a lower case sequence into bytes, with N as T."""
+    seq = seq.replace('n', 't')
+    seq += 't' * (-len(seq) % 4)
+    return ''.join([_encode[seq[i:i + 4]] for i in xrange(0, len(seq), 4)])
+
+def write_twobit(records, fname):
+    """Write sequences to a .2bit file.
+
+    :param records: an iterable of objects with ``name`` and ``seq``
+                    attributes, e.g. a :py:class:`.Fasta`,
+                    :py:class:`.FastaReader`, :py:class:`.GenBank` or
+                    :py:class:`.TwoBit` object.
+    :param fname: filename of the .2bit file.
+    :raises: ValueError if a name is longer than 255 characters or if
+             a name occurs more than once.
+    """
+    records = [(x.name, str(x.seq)) for x in records]
+    names = set()
+    for name, seq in records:
+        if len(name) > 255:
+            raise ValueError('sequence name too long: {0}'.format(name))
+        if name in names:
+            raise ValueError('duplicate sequence name: {0}'.format(name))
+        names.add(name)
+
+    with open(fname, 'wb') as f:
+        f.write(struct.pack('<IIII', signature, 0, len(records), 0))
+        offset = 16 + sum(5 + len(name) for name, seq in records)
+        for name, seq in records:
+            f.write(chr(len(name)) + name + struct.pack('<I', offset))
+            nblock_count = len(re.findall('n+', seq))
+            offset += 16 + 8 * nblock_count + (len(seq) + 3) // 4
+
+        for name, seq in records:
+            nblocks = [(m.start(), m.end() - m.start()) \
+                for m in re.finditer('n+', seq)]
+            f.write(struct.pack('<II', len(seq), len(nblocks)))
+            f.write(struct.pack('<{0}I'.format(len(nblocks)),
+                *[x[0] for x in nblocks]))
+            f.write(struct.pack('<{0}I'.format(len(nblocks)),
+                *[x[1] for x in nblocks]))
+            f.write(struct.pack('<II', 0, 0))
+            f.write(_pack(seq))